@@ -0,0 +1,18 @@
+from database import connect_to_mongo, create_indexes
+from util.backfill import backfill_dates
+
+
+async def main():
+    await connect_to_mongo()
+    await create_indexes()
+
+    result = await backfill_dates()
+
+    for collection, count in result.items():
+        print(f"{collection}: {count} documents backfilled")
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    asyncio.run(main())
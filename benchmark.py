@@ -0,0 +1,139 @@
+import argparse
+import random
+import time
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import settings
+from database import db
+from util.batch_calculate import calculate_time_batch
+from util.calculate import calculate_time, calculate_time_combined
+from util.vector_calculate import calculate_time_vector
+
+modes = ["on-campus", "off-campus", "social-practice"]
+statuses = ["effective", "effective", "effective", "pending"]
+
+
+def member(user: str, award: str | None = None) -> dict:
+    result = {
+        "_id": user,
+        "status": random.choice(statuses),
+        "mode": random.choice(modes),
+        "duration": round(random.uniform(0.5, 4.0), 1),
+    }
+    if award is not None:
+        result["award"] = award
+    return result
+
+
+async def seed(users: int, activities: int, trophies: int):
+    await db.zvms.activities.drop()
+    await db.zvms.trophies.drop()
+    oids = [str(ObjectId()) for _ in range(users)]
+    await db.zvms.activities.insert_many(
+        [
+            {
+                "name": f"Activity {i}",
+                "type": random.choice(["specified", "social", "scale", "special"]),
+                "status": random.choice(["effective", "pending"]),
+                "special": {"classify": random.choice(["prize", "import", "club"])},
+                "members": [member(oid) for oid in random.sample(oids, 30)],
+            }
+            for i in range(activities)
+        ]
+    )
+    await db.zvms.trophies.insert_many(
+        [
+            {
+                "name": f"Trophy {i}",
+                "award": "First",
+                "awards": [{"name": "First", "duration": 3.0}],
+                "members": [member(oid, "First") for oid in random.sample(oids, 5)],
+            }
+            for i in range(trophies)
+        ]
+    )
+    await db.zvms.activities.create_index("members._id")
+    await db.zvms.trophies.create_index("members._id")
+    return oids
+
+
+async def measure(function, users: list[str]) -> list[float]:
+    result = []
+    for user in users:
+        start = time.perf_counter()
+        await function(user)
+        result.append((time.perf_counter() - start) * 1000)
+    return sorted(result)
+
+
+def percentile(samples: list[float], p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def refuse_live_database(database: str):
+    """
+    Seeding drops collections and the whole database afterwards,
+    only run against an empty scratch database
+    """
+    if database in ("zvms", getattr(settings, "MONGODB_DB", "")):
+        raise SystemExit(f"Refusing to run against the app database {database!r}")
+    for name in await db.zvms.list_collection_names():
+        if await db.zvms[name].estimated_document_count() > 0:
+            raise SystemExit(
+                f"Refusing to run, {database}.{name} already holds documents"
+            )
+
+
+async def main(args):
+    db.client = AsyncIOMotorClient(args.uri)
+    db.zvms = db.client[args.database]
+    await refuse_live_database(args.database)
+
+    users = await seed(args.users, args.activities, args.trophies)
+    sample = random.sample(users, min(args.samples, len(users)))
+
+    mismatches = 0
+    for user in sample:
+        if await calculate_time(user) != await calculate_time_combined(user):
+            mismatches += 1
+    print(f"{mismatches} of {len(sample)} users differ between both modes")
+
+    for name, function in [
+        ("calculate_time", calculate_time),
+        ("calculate_time_combined", calculate_time_combined),
+    ]:
+        samples = await measure(function, sample)
+        print(
+            f"{name:<24} p50 {percentile(samples, 0.5):7.2f} ms"
+            f"  p99 {percentile(samples, 0.99):7.2f} ms"
+        )
+
+    # Whole-school calculation, the columnar evaluator must match the scalar rules
+    start = time.perf_counter()
+    scalar = await calculate_time_batch(users)
+    print(f"{'calculate_time_batch':<24} {(time.perf_counter() - start) * 1000:7.2f} ms")
+    start = time.perf_counter()
+    vector = await calculate_time_vector(users)
+    print(f"{'calculate_time_vector':<24} {(time.perf_counter() - start) * 1000:7.2f} ms")
+    differ = [user for user in users if scalar[user] != vector[user]]
+    print(f"{len(differ)} of {len(users)} users differ between scalar and vector rules")
+
+    await db.client.drop_database(args.database)
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    parser = argparse.ArgumentParser(
+        description="Compare calculate_time latency against a seeded local mongod"
+    )
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="zvms_benchmark")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--activities", type=int, default=3000)
+    parser.add_argument("--trophies", type=int, default=500)
+    parser.add_argument("--samples", type=int, default=500)
+
+    asyncio.run(main(parser.parse_args()))
@@ -1,6 +1,7 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 import settings
 import logging
+from pymongo.errors import OperationFailure
 
 
 class DataBase:
@@ -22,6 +23,73 @@ async def connect_to_mongo():
     logging.info("connected to zvms...")
 
 
+async def create_indexes():
+    logging.info("Creating indexes...")
+    # Date range queries on a user's activities and trophies
+    await db.zvms.activities.create_index([("members._id", 1), ("dateAt", 1)])
+    await db.zvms.activities.create_index([("dateAt", 1)])
+    await db.zvms.trophies.create_index([("members._id", 1), ("timeAt", 1)])
+    # Filters allowed by generic collection exports
+    await db.zvms.activities.create_index([("type", 1)])
+    await db.zvms.activities.create_index([("status", 1)])
+    await db.zvms.activities.create_index([("creator", 1)])
+    await db.zvms.trophies.create_index([("status", 1)])
+    await db.zvms.trophies.create_index([("creator", 1)])
+    await db.zvms.trophies.create_index([("timeAt", 1)])
+    await db.zvms.notifications.create_index([("publisher", 1)])
+    await db.zvms.notifications.create_index([("type", 1)])
+    await db.zvms.users.create_index([("group", 1)])
+    await db.zvms.groups.create_index([("type", 1)])
+    await create_unique_user_id_index()
+    # Spent and expired refresh tokens
+    await db.zvms.refresh_tokens.create_index([("family", 1)])
+    await db.zvms.refresh_tokens.create_index([("expiresAt", 1)], expireAfterSeconds=0)
+    # Revoked tokens, synced by `revokedAt` and dropped once expired
+    await db.zvms.revoked_tokens.create_index([("revokedAt", 1)])
+    await db.zvms.revoked_tokens.create_index([("expiresAt", 1)], expireAfterSeconds=0)
+    logging.info("created indexes")
+
+
+async def create_unique_user_id_index():
+    """
+    Login ids are unique, duplicates are merged at `/api/merge/user`
+    """
+    indexes = await db.zvms.users.index_information()
+    if "id_1" in indexes and indexes["id_1"].get("unique"):
+        return
+    duplicates = await db.zvms.users.aggregate(
+        [
+            {"$group": {"_id": "$id", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": 10},
+        ]
+    ).to_list(None)
+    if duplicates:
+        # Keep the current index, logins stay indexed until duplicates are merged
+        await db.zvms.users.create_index([("id", 1)])
+        logging.warning(
+            "users.id is not unique, merge duplicate users: "
+            + ", ".join(str(duplicate["_id"]) for duplicate in duplicates)
+        )
+        return
+    if "id_1" in indexes:
+        # Built non-unique before, the options of an index can't be changed in place
+        try:
+            await db.zvms.users.drop_index("id_1")
+        except OperationFailure as e:
+            # Dropped by another worker starting at the same time
+            if e.code != 27:
+                raise
+    try:
+        await db.zvms.users.create_index([("id", 1)], unique=True)
+    except OperationFailure as e:
+        if e.code != 11000:
+            raise
+        # A duplicate was inserted since the check
+        await db.zvms.users.create_index([("id", 1)])
+        logging.warning(f"users.id is not unique, merge duplicate users: {e}")
+
+
 async def close_mongo_connection():
     logging.info("closing connection...")
     db.client.close()
@@ -0,0 +1,26 @@
+import argparse
+
+from database import connect_to_mongo
+from util.user_time import rebuild_user_time
+
+
+async def main(fix: bool):
+    await connect_to_mongo()
+
+    drifts = await rebuild_user_time(fix)
+
+    for drift in drifts:
+        print(drift["user"], drift["ledger"], "->", drift["actual"])
+    print(f"{len(drifts)} drifted entries", "rewritten" if fix else "found")
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Rebuild or verify the user_time ledger")
+    parser.add_argument(
+        "--verify", action="store_true", help="only report drift, don't rewrite"
+    )
+    args = parser.parse_args()
+
+    asyncio.run(main(not args.verify))
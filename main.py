@@ -1,4 +1,4 @@
-from fastapi import Request, Response, FastAPI
+from fastapi import Depends, HTTPException, Request, Response, FastAPI
 from fastapi.exceptions import RequestValidationError
 from routers import (
     notifications_router,
@@ -6,8 +6,20 @@ from routers import (
     activities_router,
     groups_router,
     trophies_router,
+    exports_router,
+    imports_router,
+    merge_router,
 )
-from database import close_mongo_connection, connect_to_mongo
+from database import close_mongo_connection, connect_to_mongo, create_indexes
+from util.artifact_store import start_artifact_sweeper, stop_artifact_sweeper
+from util.export_jobs import start_export_workers, stop_export_workers
+from util.group_directory import start_group_directory, stop_group_directory
+from util.roster_import import start_import_workers, stop_import_workers
+from util.rate_limit import login_admission
+from util.revocation import revocations, start_revocation_sync, stop_revocation_sync
+from util.crypto_pool import crypto_pool
+from util.user_time import time_cache
+from utils import get_current_user, token_cache
 import socketio
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -37,6 +49,17 @@ app.add_middleware(
 
 # 注册事件
 app.add_event_handler("startup", connect_to_mongo)
+app.add_event_handler("startup", create_indexes)
+app.add_event_handler("startup", start_group_directory)
+app.add_event_handler("startup", start_revocation_sync)
+app.add_event_handler("startup", start_artifact_sweeper)
+app.add_event_handler("startup", start_export_workers)
+app.add_event_handler("startup", start_import_workers)
+app.add_event_handler("shutdown", stop_import_workers)
+app.add_event_handler("shutdown", stop_export_workers)
+app.add_event_handler("shutdown", stop_artifact_sweeper)
+app.add_event_handler("shutdown", stop_revocation_sync)
+app.add_event_handler("shutdown", stop_group_directory)
 app.add_event_handler("shutdown", close_mongo_connection)
 
 # 注册路由
@@ -49,6 +72,9 @@ app.include_router(
 )
 app.include_router(groups_router.router, prefix="/api/group", tags=["groups"])
 app.include_router(trophies_router.router, prefix="/api/trophy", tags=["trophies"])
+app.include_router(exports_router.router, prefix="/api/export", tags=["exports"])
+app.include_router(imports_router.router, prefix="/api/import", tags=["imports"])
+app.include_router(merge_router.router, prefix="/api/merge", tags=["merge"])
 
 
 # Custom exception handler for internal server errors
@@ -83,6 +109,23 @@ async def get_version():
     return {"status": "ok", "code": 200, "data": "0.1.0-alpha.1"}
 
 
+@app.get("/api/metrics")
+async def get_metrics(user=Depends(get_current_user)):
+    if "admin" not in user["per"]:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return {
+        "status": "ok",
+        "code": 200,
+        "data": {
+            "timeCache": time_cache.stats(),
+            "cryptoPool": crypto_pool.stats(),
+            "tokenCache": token_cache.stats(),
+            "revocations": revocations.stats(),
+            "loginAdmission": login_admission.stats(),
+        },
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -6,10 +6,20 @@ from typings.activity import (
     MemberActivityStatus,
     SpecialActivityClassify,
 )
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, UploadFile
 from util.get_class import get_activities_related_to_user
 from util.group import is_in_a_same_class
-from utils import compulsory_temporary_token, get_current_user, validate_object_id
+from util.calculate import date_match
+from util.member_import import import_members, member_columns
+from util.spreadsheet import read_upload_chunks
+from util.user_time import refresh_user_time
+from utils import (
+    compulsory_temporary_token,
+    get_current_user,
+    parse_iso_date,
+    validate_date,
+    validate_object_id,
+)
 from datetime import datetime
 from database import db
 from pydantic import BaseModel
@@ -72,12 +82,15 @@ async def create_activity(payload: Activity, user=Depends(get_current_user)):
         del member["id"]
 
     diction["members"] = members
+    diction["dateAt"] = parse_iso_date(diction["date"])
 
     # Crezate activity
     result = await db.zvms.activities.insert_one(diction)
 
     id = result.inserted_id
 
+    await refresh_user_time([member["_id"] for member in members])
+
     return {"status": "ok", "code": 201, "data": str(id)}
 
 
@@ -177,6 +190,8 @@ async def change_activity_status(
         {"$set": {"status": status, "updatedAt": int(datetime.now().timestamp())}},
     )
 
+    await refresh_user_time([member["_id"] for member in target_activity["members"]])
+
     return {
         "status": "ok",
         "code": 200,
@@ -190,11 +205,14 @@ async def read_activities(
     page: int = -1,
     perpage: int = 10,
     query: str = "",
+    start: str | None = None,
+    end: str | None = None,
     user=Depends(get_current_user),
 ):
     """
     Return activities
     """
+    dates = date_match("dateAt", validate_date(start), validate_date(end))
 
     # User permission check
     if (
@@ -220,6 +238,7 @@ async def read_activities(
             {
                 "$match": {
                     "name": {"$regex": query, "$options": "i"},
+                    **dates,
                 }
             },
             {
@@ -277,7 +296,7 @@ async def read_activities(
         ]
 
         count = await db.zvms.activities.count_documents(
-            {"name": {"$regex": query, "$options": "i"}}
+            {"name": {"$regex": query, "$options": "i"}, **dates}
         )
         activities = await db.zvms.activities.aggregate(pipeline).to_list(None)
         for activity in activities:
@@ -290,7 +309,7 @@ async def read_activities(
         }
     elif mode == "class":
         result, count = await get_activities_related_to_user(
-            user["id"], page, perpage, query
+            user["id"], page, perpage, query, dates=dates
         )
         return {
             "status": "ok",
@@ -478,12 +497,47 @@ async def user_activity_signup(
         {"$addToSet": {"members": diction}},
     )
 
+    await refresh_user_time([member.id])
+
     return {
         "status": "ok",
         "code": 201,
     }
 
 
+@router.post("/{activity_oid}/member/import")
+async def import_activity_members(
+    activity_oid: str, file: UploadFile, user=Depends(get_current_user)
+):
+    """
+    Append members from a sheet of student id, duration and mode
+    """
+
+    if "admin" not in user["per"]:
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    activity = await db.zvms.activities.find_one(
+        {"_id": validate_object_id(activity_oid)}
+    )
+
+    if not activity:
+        raise HTTPException(status_code=404, detail="Activity not found")
+
+    special = activity.get("special") or {}
+    if special.get("classify") != SpecialActivityClassify.import_:
+        raise HTTPException(
+            status_code=400, detail="Members can only be imported to import activities"
+        )
+
+    report = await import_members(activity, read_upload_chunks(file, member_columns))
+
+    return {
+        "status": "ok",
+        "code": 201,
+        "data": report,
+    }
+
+
 @router.get("/{activity_oid}/member/{uid}")
 async def read_activity_user(
     activity_oid: str, uid: str, user=Depends(get_current_user)
@@ -563,6 +617,8 @@ async def user_activity_signoff(
         {"$pull": {"members": {"_id": uid}}},
     )
 
+    await refresh_user_time([uid])
+
     return {
         "status": "ok",
         "code": 200,
@@ -593,6 +649,8 @@ async def delete_activity(activity_oid: str, user=Depends(compulsory_temporary_t
         {"_id": validate_object_id(activity_oid)}
     )
 
+    await refresh_user_time([member["_id"] for member in activity["members"]])
+
     return {
         "status": "ok",
         "code": 200,
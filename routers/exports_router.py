@@ -1,244 +1,159 @@
-# import pandas as pd
-# from h11 import Request
-# from pydantic import BaseModel
-#
-# from typings.export import Export, ExportFormat, ExportStatus, ExportResponse
-# from fastapi import APIRouter, Depends, HTTPException, Response
-# from bson import ObjectId
-# from database import connect_to_mongo, db
-# from util.time_export import calculate, json2csv, json2xlsx
-# from utils import get_current_user
-# from uuid import uuid4
-# import datetime
-# import asyncio
-#
-# router = APIRouter()
-#
-# exports: list[ExportResponse] = []
-#
-#
-# @router.post('')
-# async def create_exports(
-#     # mode: Export,
-#     # user=Depends(get_current_user)
-# ):
-#     pipeline = \
-#         [
-#             {
-#                 '$lookup': {
-#                     'from': 'activities',
-#                     'let': {
-#                         'userIdStr': {
-#                             '$toString': '$_id'
-#                         }
-#                     },
-#                     'pipeline': [
-#                         {
-#                             '$unwind': '$members'
-#                         }, {
-#                             '$match': {
-#                                 '$expr': {
-#                                     '$and': [
-#                                         {
-#                                             '$eq': [
-#                                                 '$members._id', '$$userIdStr'
-#                                             ]
-#                                         }, {
-#                                             '$eq': [
-#                                                 '$members.status', 'effective'
-#                                             ]
-#                                         }
-#                                     ]
-#                                 }
-#                             }
-#                         }
-#                     ],
-#                     'as': 'user_activities'
-#                 }
-#             }, {
-#                 '$addFields': {
-#                     'groupObjectIds': {
-#                         '$map': {
-#                             'input': '$group',
-#                             'as': 'groupIdStr',
-#                             'in': {
-#                                 '$toObjectId': '$$groupIdStr'
-#                             }
-#                         }
-#                     }
-#                 }
-#             }, {
-#                 '$lookup': {
-#                     'from': 'groups',
-#                     'let': {
-#                         'userGroups': '$groupObjectIds'
-#                     },
-#                     'pipeline': [
-#                         {
-#                             '$match': {
-#                                 '$expr': {
-#                                     '$and': [
-#                                         {
-#                                             '$in': [
-#                                                 '$_id', '$$userGroups'
-#                                             ]
-#                                         }, {
-#                                             '$eq': [
-#                                                 '$type', 'class'
-#                                             ]
-#                                         }
-#                                     ]
-#                                 }
-#                             }
-#                         }, {
-#                             '$project': {
-#                                 'name': 1
-#                             }
-#                         }
-#                     ],
-#                     'as': 'user_classes'
-#                 }
-#             }, {
-#                 '$unwind': '$user_activities'
-#             }, {
-#                 '$group': {
-#                     '_id': {
-#                         'userId': '$_id',
-#                         'mode': '$user_activities.members.mode',
-#                         'name': '$name',
-#                         'userIdNumber': '$id',
-#                         'class': {
-#                             '$arrayElemAt': [
-#                                 '$user_classes.name', 0
-#                             ]
-#                         }
-#                     },
-#                     'totalDuration': {
-#                         '$sum': '$user_activities.members.duration'
-#                     }
-#                 }
-#             }, {
-#                 '$group': {
-#                     '_id': '$_id.userId',
-#                     'name': {
-#                         '$first': '$_id.name'
-#                     },
-#                     'id': {
-#                         '$first': '$_id.userIdNumber'
-#                     },
-#                     'class': {
-#                         '$first': '$_id.class'
-#                     },
-#                     'modes': {
-#                         '$push': {
-#                             'mode': '$_id.mode',
-#                             'totalDuration': '$totalDuration'
-#                         }
-#                     }
-#                 }
-#             }, {
-#                 '$project': {
-#                     '_id': 0,
-#                     'id': 1,
-#                     'name': 1,
-#                     'class': 1,
-#                     'on_campus': {
-#                         '$cond': {
-#                             'if': {
-#                                 '$in': [
-#                                     'on-campus', '$modes.mode'
-#                                 ]
-#                             },
-#                             'then': {
-#                                 '$arrayElemAt': [
-#                                     {
-#                                         '$filter': {
-#                                             'input': '$modes',
-#                                             'as': 'mode',
-#                                             'cond': {
-#                                                 '$eq': [
-#                                                     '$$mode.mode', 'on-campus'
-#                                                 ]
-#                                             }
-#                                         }
-#                                     }, 0
-#                                 ]
-#                             },
-#                             'else': {
-#                                 'mode': 'on-campus',
-#                                 'totalDuration': 0
-#                             }
-#                         }
-#                     },
-#                     'off_campus': {
-#                         '$cond': {
-#                             'if': {
-#                                 '$in': [
-#                                     'off-campus', '$modes.mode'
-#                                 ]
-#                             },
-#                             'then': {
-#                                 '$arrayElemAt': [
-#                                     {
-#                                         '$filter': {
-#                                             'input': '$modes',
-#                                             'as': 'mode',
-#                                             'cond': {
-#                                                 '$eq': [
-#                                                     '$$mode.mode', 'off-campus'
-#                                                 ]
-#                                             }
-#                                         }
-#                                     }, 0
-#                                 ]
-#                             },
-#                             'else': {
-#                                 'mode': 'off-campus',
-#                                 'totalDuration': 0
-#                             }
-#                         }
-#                     },
-#                     'social_practice': {
-#                         '$cond': {
-#                             'if': {
-#                                 '$in': [
-#                                     'social-practice', '$modes.mode'
-#                                 ]
-#                             },
-#                             'then': {
-#                                 '$arrayElemAt': [
-#                                     {
-#                                         '$filter': {
-#                                             'input': '$modes',
-#                                             'as': 'mode',
-#                                             'cond': {
-#                                                 '$eq': [
-#                                                     '$$mode.mode', 'social-practice'
-#                                                 ]
-#                                             }
-#                                         }
-#                                     }, 0
-#                                 ]
-#                             },
-#                             'else': {
-#                                 'mode': 'social-practice',
-#                                 'totalDuration': 0
-#                             }
-#                         }
-#                     }
-#                 }
-#             }, {
-#                 '$project': {
-#                     'id': 1,
-#                     'name': 1,
-#                     'class': 1,
-#                     'on-campus': '$on_campus.totalDuration',
-#                     'off-campus': '$off_campus.totalDuration',
-#                     'social-practice': '$social_practice.totalDuration'
-#                 }
-#             }
-#         ]
-#     result = await db.zvms.activities.aggregate(pipeline).to_list(None)
-#     df = pd.DataFrame(result)
-#     print(df)
-#     return 123
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from database import db
+from typings.export import Export, ExportStatus
+from util.artifact_store import artifact_key, data_version, store
+from util.collection_export import collection_cursor, stream_collection
+from util.export_jobs import enqueue_export, export_response, time_users
+from util.time_export import (
+    iter_time_records,
+    json2csv_stream,
+    media_types,
+    stream_csv,
+    write_xlsx,
+)
+from utils import get_current_user, validate_date, validate_object_id
+
+router = APIRouter()
+
+
+def check_export_permission(user: dict):
+    if (
+        "admin" not in user["per"]
+        and "department" not in user["per"]
+        and "auditor" not in user["per"]
+    ):
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+
+@router.post("")
+async def create_export(payload: Export, user=Depends(get_current_user)):
+    """
+    Queue an export job
+    """
+    check_export_permission(user)
+
+    id = await enqueue_export(payload, user["id"])
+
+    return {
+        "status": "ok",
+        "code": 201,
+        "data": {"_id": id},
+    }
+
+
+@router.get("/time/csv")
+async def stream_time_csv(
+    start: str | None = None,
+    end: str | None = None,
+    discount: bool = False,
+    user=Depends(get_current_user),
+):
+    """
+    Stream everyone's time as CSV while it is calculated
+    """
+    check_export_permission(user)
+    start_date, end_date = validate_date(start), validate_date(end)
+    params = {"collection": "time", "format": "csv", "start": start, "end": end}
+    params["filters"] = {"discount": discount}
+    key = artifact_key(params, await data_version())
+    if await store.find(key) is not None:
+        return await store.response(key, media_types["csv"], "time.csv")
+    records = iter_time_records(
+        time_users(),
+        discount=discount,
+        start=start_date,
+        end=end_date,
+    )
+    return json2csv_stream(store.tee(key, stream_csv(records), "csv"))
+
+
+@router.get("/time/xlsx")
+async def stream_time_xlsx(
+    start: str | None = None,
+    end: str | None = None,
+    discount: bool = False,
+    grouped: bool = False,
+    user=Depends(get_current_user),
+):
+    """
+    Export everyone's time as xlsx, one sheet per grade if `grouped`
+    """
+    check_export_permission(user)
+    start_date, end_date = validate_date(start), validate_date(end)
+    params = {"collection": "time", "format": "xlsx", "start": start, "end": end}
+    params["filters"] = {"discount": discount, "grouped": grouped}
+    key = artifact_key(params, await data_version())
+    if await store.find(key) is None:
+        records = iter_time_records(
+            time_users(),
+            discount=discount,
+            start=start_date,
+            end=end_date,
+        )
+        path = store.staging_path("xlsx")
+        try:
+            await write_xlsx(records, path, grouped)
+            await store.put(key, path, "xlsx")
+        except Exception:
+            await store.discard(path)
+            raise
+    return await store.response(key, media_types["xlsx"], "time.xlsx")
+
+
+@router.post("/stream")
+async def stream_export(
+    payload: Export, batch_size: int = 1000, user=Depends(get_current_user)
+):
+    """
+    Stream a collection as NDJSON or CSV straight from the cursor
+    """
+    check_export_permission(user)
+    cursor = collection_cursor(payload, batch_size)
+    filename = f"{payload.collection}.{payload.format.value}"
+    return StreamingResponse(
+        content=stream_collection(cursor, payload.collection, payload.format),
+        media_type=media_types[payload.format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+async def get_own_export(export_id: str, user: dict) -> dict:
+    job = await db.zvms.exports.find_one({"_id": validate_object_id(export_id)})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if user["id"] != job["creator"] and "admin" not in user["per"]:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return job
+
+
+@router.get("/{export_id}")
+async def get_export(export_id: str, user=Depends(get_current_user)):
+    """
+    Get status and progress of an export job
+    """
+    job = await get_own_export(export_id, user)
+    return {
+        "status": "ok",
+        "code": 200,
+        "data": export_response(job).model_dump(),
+    }
+
+
+@router.get("/{export_id}/download")
+async def download_export(export_id: str, user=Depends(get_current_user)):
+    """
+    Download the file of a completed export job
+    """
+    job = await get_own_export(export_id, user)
+    if job["status"] != ExportStatus.completed:
+        raise HTTPException(status_code=409, detail="Export is not completed")
+    if await store.find(job["file"]) is None:
+        raise HTTPException(status_code=410, detail="Export has expired")
+    format = job["params"]["format"]
+    return await store.response(
+        job["file"],
+        media_types[format],
+        f"{job['params']['collection']}.{format}",
+    )
@@ -1,11 +1,20 @@
-from typings.group import Group
+from typings.group import Group, UserPosition
 from bson import ObjectId
 from fastapi import APIRouter, HTTPException, Depends
 from database import db
 from pydantic import BaseModel
+from util.artifact_store import bump_data_version
+from util.vector_calculate import calculate_time_vector
+from util.calculate import date_match
 from util.get_class import get_activities_related_to_user
+from util.group_directory import refresh_group_directory
 
-from utils import compulsory_temporary_token, get_current_user, validate_object_id
+from utils import (
+    compulsory_temporary_token,
+    get_current_user,
+    validate_date,
+    validate_object_id,
+)
 
 router = APIRouter()
 
@@ -22,6 +31,7 @@ async def create_group(payload: Group, user=Depends(get_current_user)):
     group = payload.model_dump()
 
     result = await db.zvms.groups.insert_one(group)
+    await refresh_group_directory()
 
     id = str(result.inserted_id)
 
@@ -124,6 +134,8 @@ async def update_group_name(
     await db.zvms.groups.update_one(
         {"_id": validate_object_id(group_id)}, {"$set": {"name": payload.name}}
     )
+    await refresh_group_directory()
+    await bump_data_version()
 
     return {
         "status": "ok",
@@ -137,13 +149,20 @@ async def get_class_activities(
     page: int = 1,
     perpage: int = 10,
     query: str = "",
+    start: str | None = None,
+    end: str | None = None,
     user=Depends(get_current_user),
 ):
     """
     Get activities related to a group
     """
     result, count = await get_activities_related_to_user(
-        user["id"], page, perpage, query, group_id
+        user["id"],
+        page,
+        perpage,
+        query,
+        group_id,
+        date_match("dateAt", validate_date(start), validate_date(end)),
     )
     return {
         "status": "ok",
@@ -153,16 +172,9 @@ async def get_class_activities(
     }
 
 
-@router.get("/{group_id}/user")
-async def get_users_in_class(
-    group_id: str,
-    page: int = 1,
-    perpage: int = 10,
-    search: str = "",
-    user=Depends(get_current_user),
-):
+async def check_class_permission(group_id: str, user: dict):
     """
-    Get users in a class
+    Check whether the user can read members of a class
     """
     same_class = False
     if "secretary" in user["per"]:
@@ -181,6 +193,20 @@ async def get_users_in_class(
         and (not "secretary" in user["per"] and not same_class)
     ):
         raise HTTPException(status_code=403, detail="Permission denied")
+
+
+@router.get("/{group_id}/user")
+async def get_users_in_class(
+    group_id: str,
+    page: int = 1,
+    perpage: int = 10,
+    search: str = "",
+    user=Depends(get_current_user),
+):
+    """
+    Get users in a class
+    """
+    await check_class_permission(group_id, user)
     count = await db.zvms.users.count_documents(
         {"group": group_id, "name": {"$regex": search, "$options": "i"}}
     )
@@ -196,6 +222,41 @@ async def get_users_in_class(
     return {"status": "ok", "code": 200, "data": result, "metadata": {"size": count}}
 
 
+@router.get("/{group_id}/time")
+async def get_class_time(
+    group_id: str,
+    start: str | None = None,
+    end: str | None = None,
+    user=Depends(get_current_user),
+):
+    """
+    Get time of every user in a class
+    """
+    await check_class_permission(group_id, user)
+    users = (
+        await db.zvms.users.find({"group": group_id}, {"name": True, "id": True})
+        .sort("id", 1)
+        .to_list(None)
+    )
+    times = await calculate_time_vector(
+        [str(member["_id"]) for member in users],
+        start=validate_date(start),
+        end=validate_date(end),
+    )
+    result = []
+    for member in users:
+        # Keys of `calculate_time` as they are, like the time export records
+        result.append(
+            {
+                "_id": str(member["_id"]),
+                "id": member["id"],
+                "name": member["name"],
+                **times[str(member["_id"])],
+            }
+        )
+    return {"status": "ok", "code": 200, "data": result, "metadata": {"size": len(result)}}
+
+
 class PutGroupDescription(BaseModel):
     description: str
 
@@ -214,6 +275,36 @@ async def update_group_description(
     await db.zvms.groups.update_one(
         {"_id": ObjectId(group_id)}, {"$set": {"description": payload.description}}
     )
+    await refresh_group_directory()
+
+    return {
+        "status": "ok",
+        "code": 200,
+    }
+
+
+class PutGroupPermissions(BaseModel):
+    permissions: list[UserPosition]
+
+
+@router.put("/{group_id}/permissions")
+async def update_group_permissions(
+    group_id: str,
+    payload: PutGroupPermissions,
+    user=Depends(compulsory_temporary_token),
+):
+    """
+    Update group permissions
+    """
+
+    if not "admin" in user["per"]:
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    await db.zvms.groups.update_one(
+        {"_id": validate_object_id(group_id)},
+        {"$set": {"permissions": sorted({per.value for per in payload.permissions})}},
+    )
+    await refresh_group_directory()
 
     return {
         "status": "ok",
@@ -231,6 +322,8 @@ async def delete_group(group_id: str, user=Depends(compulsory_temporary_token)):
         raise HTTPException(status_code=403, detail="Permission denied")
 
     await db.zvms.groups.delete_one({"_id": ObjectId(group_id)})
+    await refresh_group_directory()
+    await bump_data_version()
 
     return {
         "status": "ok",
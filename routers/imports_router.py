@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile
+
+from util.roster_import import import_roster, optional_columns, required_columns
+from util.spreadsheet import read_upload_chunks
+from utils import get_current_user
+
+router = APIRouter()
+
+
+@router.post("/users")
+async def import_users(file: UploadFile, user=Depends(get_current_user)):
+    """
+    Import a roster of users from CSV or XLSX
+    """
+    if "admin" not in user["per"]:
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    chunks = read_upload_chunks(file, required_columns, optional_columns)
+    report = await import_roster(chunks)
+
+    return {
+        "status": "ok",
+        "code": 200,
+        "data": report,
+    }
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+
+from util.account_merge import merge_users
+from utils import compulsory_temporary_token, validate_object_id
+
+router = APIRouter()
+
+
+class MergeUsers(BaseModel):
+    source: str  # Duplicate account, removed after the merge
+    target: str  # Account that is kept
+
+
+@router.post("/user")
+async def merge_user(payload: MergeUsers, user=Depends(compulsory_temporary_token)):
+    """
+    Merge a duplicate account into another
+    """
+
+    if "admin" not in user["per"]:
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    source = str(validate_object_id(payload.source))
+    target = str(validate_object_id(payload.target))
+
+    result = await merge_users(source, target)
+
+    return {
+        "status": "ok",
+        "code": 200,
+        "data": result,
+    }
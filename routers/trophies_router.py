@@ -10,7 +10,13 @@ from bson import ObjectId
 from database import db
 from fastapi import HTTPException, APIRouter, Depends
 from util.group import is_in_a_same_class
-from utils import compulsory_temporary_token, get_current_user, validate_object_id
+from util.user_time import refresh_user_time
+from utils import (
+    compulsory_temporary_token,
+    get_current_user,
+    parse_iso_date,
+    validate_object_id,
+)
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -38,6 +44,7 @@ async def create_trophy(request: Trophy, user=Depends(get_current_user)):
     request.createdAt = datetime.now().isoformat()
     # Create trophy
     trophy = request.model_dump()
+    trophy["timeAt"] = parse_iso_date(trophy["time"])
     result = await db.zvms.trophies.insert_one(trophy)
     return {
         "status": "ok",
@@ -133,6 +140,7 @@ async def delete_trophy(trophy_oid: str, user=Depends(compulsory_temporary_token
         raise HTTPException(status_code=403, detail="Permission denied")
     # Delete trophy
     await db.zvms.trophies.delete_one({"_id": validate_object_id(trophy_oid)})
+    await refresh_user_time([member.get("_id") for member in trophy["members"]])
     return {"status": "ok", "code": 200}
 
 
@@ -163,6 +171,7 @@ async def add_trophy_member(
         {"_id": validate_object_id(trophy_oid)},
         {"$push": {"members": diction}},
     )
+    await refresh_user_time([target])
     return {"status": "ok", "code": 201}
 
 
@@ -194,6 +203,7 @@ async def update_trophy_member_status(
         {"_id": validate_object_id(trophy_oid), "members._id": member_oid},
         {"$set": {"members.$.status": request.status}},
     )
+    await refresh_user_time([member_oid])
     return {"status": "ok", "code": 200}
 
 
@@ -218,6 +228,7 @@ async def update_trophy_member_mode(
         {"_id": validate_object_id(trophy_oid), "members._id": member_oid},
         {"$set": {"members.$.mode": request.mode}},
     )
+    await refresh_user_time([member_oid])
     return {"status": "ok", "code": 200}
 
 
@@ -245,6 +256,7 @@ async def delete_trophy_member(
         {"_id": validate_object_id(trophy_oid)},
         {"$pull": {"members": {"_id": member_oid}}},
     )
+    await refresh_user_time([member_oid])
     return {"status": "ok", "code": 200}
 
 
@@ -265,6 +277,7 @@ async def add_trophy_award(
         {"_id": validate_object_id(trophy_oid)},
         {"$push": {"awards": award}},
     )
+    await refresh_user_time([member.get("_id") for member in trophy["members"]])
     return {"status": "ok", "code": 201}
 
 
@@ -287,6 +300,7 @@ async def delete_trophy_award(
             "$pull": {"awards": {"_id": award_oid}},
         },
     )
+    await refresh_user_time([member.get("_id") for member in trophy["members"]])
     return {"status": "ok", "code": 200}
 
 
@@ -314,4 +328,5 @@ async def update_trophy_award_duration(
         {"_id": validate_object_id(trophy_oid), "awards._id": award_oid},
         {"$set": {"awards.$.duration": request.duration}},
     )
+    await refresh_user_time([member.get("_id") for member in trophy["members"]])
     return {"status": "ok", "code": 200}
@@ -1,16 +1,34 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 
 from pydantic import BaseModel
-from util.calculate import calculate_time
 from util.group import is_in_a_same_class
 from utils import (
     compulsory_temporary_token,
     get_current_user,
+    oauth2_scheme,
     validate_object_id,
-    string_to_option_object_id
+    validate_date,
 )
 from database import db
-from util.cert import get_hashed_password_by_cert, validate_by_cert
+from util.cert import (
+    find_login_user,
+    get_hashed_password_by_cert,
+    jwt_decode,
+    jwt_encode,
+    validate_by_cert,
+)
+from util.group import get_user_permissions
+from util.calculate import calculate_time_combined, date_match
+from util.artifact_store import bump_data_version
+from util.refresh_tokens import (
+    issue_refresh_token,
+    revoke_refresh_token,
+    revoke_user_refresh_tokens,
+    rotate_refresh_token,
+)
+from util.rate_limit import login_admission
+from util.revocation import revoke_token
+from util.user_time import get_user_time
 
 router = APIRouter()
 
@@ -22,7 +40,7 @@ class AuthUser(BaseModel):
 
 
 @router.post("/auth")
-async def auth_user(auth: AuthUser):
+async def auth_user(auth: AuthUser, request: Request):
     id = auth.id
     mode = auth.mode
     credential = auth.credential
@@ -30,20 +48,71 @@ async def auth_user(auth: AuthUser):
     if mode is None:
         mode = "long"
 
-    if string_to_option_object_id(id) is None:
-        users = await db.zvms.users.find({"id": id}).to_list(None)
-        if len(users) != 1:
-            raise HTTPException(status_code=404, detail="The id of the user is not found, or there are multiple users with the same id.")
-        id = str(users[0]["_id"])
-
-    result = await validate_by_cert(id, credential, mode)
+    # Lookups and credential checks are costly, limit them per client and account
+    client = request.client.host if request.client else None
+    async with login_admission.admit(client):
+        # The only read of the user in the login
+        user = await find_login_user(id)
+        id = str(user["_id"])
+        login_admission.charge(id)
+        result = await validate_by_cert(id, credential, mode, user)
 
     return {
         "token": result,
+        "refresh": await issue_refresh_token(id),
+        "_id": id,
+    }
+
+
+class RefreshToken(BaseModel):
+    refresh: str
+    mode: str = "long"
+
+
+@router.post("/refresh")
+async def refresh_token(payload: RefreshToken):
+    """
+    Exchange a refresh token for a new token and refresh token, without a password
+    """
+    id, refresh = await rotate_refresh_token(payload.refresh)
+
+    user = await db.zvms.users.find_one(
+        {"_id": validate_object_id(id)}, {"group": True}
+    )
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return {
+        "token": jwt_encode(id, await get_user_permissions(user), type=payload.mode),
+        "refresh": refresh,
         "_id": id,
     }
 
 
+class Logout(BaseModel):
+    refresh: str | None = None
+
+
+@router.post("/logout")
+async def logout(
+    payload: Logout,
+    token: str = Depends(oauth2_scheme),
+    user=Depends(get_current_user),
+):
+    """
+    Revoke the current token, and the refresh token of the session if given
+    """
+    claims = jwt_decode(token)
+    await revoke_token(claims["jti"], user["id"], claims["exp"])
+    if payload.refresh is not None:
+        await revoke_refresh_token(payload.refresh)
+
+    return {
+        "status": "ok",
+        "code": 200,
+    }
+
+
 class PutPassword(BaseModel):
     credential: str
 
@@ -72,6 +141,8 @@ async def change_password(
     await db.zvms.users.update_one(
         {"_id": validate_object_id(user_oid)}, {"$set": {"password": str(password)}}
     )
+    # Sessions of the old password must not outlive it
+    await revoke_user_refresh_tokens(str(validate_object_id(user_oid)))
 
     return {
         "status": "ok",
@@ -157,6 +228,7 @@ async def update_user(user_oid: str, user_struct: PutUser, user=Depends(compulso
             }
         },
     )
+    await bump_data_version()
 
     return {
         "status": "ok",
@@ -175,6 +247,7 @@ async def add_user_to_group(
         {"_id": validate_object_id(user_oid)},
         {"$addToSet": {"group": validate_object_id(group_id)}},
     )
+    await bump_data_version()
 
 
 @router.delete("/{user_oid}/group/{group_id}")
@@ -189,6 +262,7 @@ async def remove_user_from_group(
         {"_id": validate_object_id(user_oid)},
         {"$pull": {"group": validate_object_id(group_id)}},
     )
+    await bump_data_version()
 
 
 @router.get("/{user_oid}/activity")
@@ -198,17 +272,20 @@ async def read_user_activity(
     page: int = -1,
     perpage: int = 10,
     query: str = "",
+    start: str | None = None,
+    end: str | None = None,
 ):
     """
     Return user's activities
     """
+    dates = date_match("dateAt", validate_date(start), validate_date(end))
     # Check user's permission
 
     if "admin" not in user["per"] and user["id"] != str(validate_object_id(user_oid)):
         raise HTTPException(status_code=403, detail="Permission denied")
 
     count = await db.zvms.activities.count_documents(
-        {"members._id": str(validate_object_id(user_oid))},
+        {"members._id": str(validate_object_id(user_oid)), **dates},
         # {"name": {"$regex": query, "$options": "i"}},
     )
     # Read user's activities
@@ -217,6 +294,7 @@ async def read_user_activity(
             '$match': {
                 'members._id': user_oid,
                 'name': {'$regex': query, '$options': 'i'},
+                **dates,
             }
         },
         {
@@ -263,9 +341,14 @@ async def read_user_activity(
 
 
 @router.get("/{user_oid}/time")
-async def read_user_time(user_oid: str, user=Depends(get_current_user)):
+async def read_user_time(
+    user_oid: str,
+    start: str | None = None,
+    end: str | None = None,
+    user=Depends(get_current_user),
+):
     """
-    Return user's time
+    Return user's time, within [start, end) if given
     """
     # Check user's permission
     if (
@@ -275,7 +358,13 @@ async def read_user_time(user_oid: str, user=Depends(get_current_user)):
     ):
         raise HTTPException(status_code=403, detail="Permission denied")
 
-    result = await calculate_time(user_oid)
+    if start is None and end is None:
+        result = await get_user_time(user_oid)
+    else:
+        # The ledger only keeps all-time totals
+        result = await calculate_time_combined(
+            user_oid, start=validate_date(start), end=validate_date(end)
+        )
     return {
         "status": "ok",
         "code": 200,
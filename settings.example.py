@@ -3,3 +3,4 @@ MONGODB_DB = ""  # MongoDB Database
 SECRET_KEY = ""  # Secret Key
 IMGBED_SECRET_KEY = ""  # Imagebed Secret Key
 IMGBED_SERVER = ""  # Imagebed server
+ARTIFACT_STORAGE = "local"  # Export artifact storage, local or gridfs
@@ -0,0 +1,146 @@
+import random
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from util.calculate import combine_time, summarize_awards, summarize_durations
+from util.vector_calculate import _round, _trophy_duration, evaluate_time_rows
+
+modes = ["on-campus", "off-campus", "social-practice"]
+
+
+def random_duration(rng: random.Random) -> float:
+    return round(rng.uniform(0.1, 6.0), 1)
+
+
+def random_user(rng: random.Random) -> dict[str, list]:
+    """
+    Member entries of one user by category, in document order
+    """
+    def members(count: int) -> list[dict]:
+        return [
+            {"mode": rng.choice(modes), "duration": random_duration(rng)}
+            for _ in range(count)
+        ]
+
+    trophies = []
+    for _ in range(rng.randint(0, 5)):
+        awards = [
+            {"name": name, "duration": random_duration(rng)}
+            for name in rng.sample(["First", "Second", "Third"], rng.randint(1, 3))
+        ]
+        trophies.append(
+            {
+                "award": rng.choice(["First", "Second", "Third"]),
+                "awards": awards,
+                "members": [{"mode": rng.choice(modes)}],
+            }
+        )
+    return {
+        "normal": members(rng.randint(0, 8)),
+        "special": members(rng.randint(0, 3)),
+        "prize": members(rng.randint(0, 4)),
+        "trophy": trophies,
+    }
+
+
+def scalar_time(user: dict, **rules) -> dict[str, float]:
+    awards = summarize_awards(user["prize"], user["trophy"], rules["prize_full"])
+    return combine_time(
+        awards,
+        summarize_durations(user["normal"]),
+        summarize_durations(user["special"]),
+        rules["discount"],
+        rules["discount_rate"],
+        rules["discount_full"],
+        rules["discount_base"],
+    )
+
+
+def member_rows(users: dict[str, dict]) -> pd.DataFrame:
+    """
+    Flatten users the way `load_member_rows` does
+    """
+    rows = []
+    for oid, user in users.items():
+        for kind in ("normal", "special", "prize"):
+            for member in user[kind]:
+                rows.append((oid, kind, member["mode"], member["duration"]))
+        for trophy in user["trophy"]:
+            member = trophy["members"][0]
+            duration = _trophy_duration(trophy, member)
+            if duration is not None:
+                rows.append((oid, "trophy", member["mode"], duration))
+    return pd.DataFrame(rows, columns=["user", "kind", "mode", "duration"])
+
+
+class EvaluateTimeRowsTest(unittest.TestCase):
+    def assert_matches(self, users: dict[str, dict], **rules):
+        vector = evaluate_time_rows(
+            member_rows(users), list(users), **rules
+        ).to_dict(orient="index")
+        for oid, user in users.items():
+            self.assertEqual(vector[oid], scalar_time(user, **rules), oid)
+
+    def test_random_users(self):
+        rng = random.Random(20240501)
+        for discount in (False, True):
+            for prize_full, discount_base in ((10.0, 30.0), (6.0, 8.0)):
+                users = {str(i): random_user(rng) for i in range(2000)}
+                self.assert_matches(
+                    users,
+                    prize_full=prize_full,
+                    discount=discount,
+                    discount_rate=1 / 3,
+                    discount_full=6.0,
+                    discount_base=discount_base,
+                )
+
+    def test_capped_prize_rounds_like_round(self):
+        # 5.1 / 20 * 10 is stored as 2.5499..., `round` gives 2.5, `np.round` 2.6
+        users = {
+            "a": {
+                "normal": [],
+                "special": [],
+                "prize": [
+                    {"mode": "on-campus", "duration": 5.1},
+                    {"mode": "off-campus", "duration": 14.9},
+                ],
+                "trophy": [],
+            }
+        }
+        rules = dict(
+            prize_full=10.0,
+            discount=False,
+            discount_rate=1 / 3,
+            discount_full=6.0,
+            discount_base=30.0,
+        )
+        self.assert_matches(users, **rules)
+        self.assertEqual(scalar_time(users["a"], **rules)["on-campus"], 2.5)
+
+    def test_round_matches_round(self):
+        rng = random.Random(20240502)
+        values = [2.55, 0.05, 0.15, -2.55, 0.0, 1e6 + 0.05]
+        for _ in range(50000):
+            values.append(rng.randint(-100000, 100000) / 100)
+            values.append(sum(random_duration(rng) for _ in range(rng.randint(1, 30))))
+            values.append(rng.uniform(0.1, 12) / rng.uniform(0.1, 30) * 10)
+        rounded = _round(np.array(values)).tolist()
+        self.assertEqual(rounded, [round(value, 1) for value in values])
+
+    def test_user_without_rows(self):
+        users = {"a": {"normal": [], "special": [], "prize": [], "trophy": []}}
+        self.assert_matches(
+            users,
+            prize_full=10.0,
+            discount=True,
+            discount_rate=1 / 3,
+            discount_full=6.0,
+            discount_base=30.0,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
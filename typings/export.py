@@ -14,10 +14,13 @@ class ExportFormat(str, Enum):
     json = "json"
     csv = "csv"
     xlsx = "xlsx"
+    parquet = "parquet"
+    arrow = "arrow"  # Arrow IPC file
+    ndjson = "ndjson"  # One JSON document per line
 
 
 class Export(BaseModel):
-    collection: str  # `time`, `trophies`, `activities`, `notifications`, `users`, `groups`, etc.
+    collection: str  # `time`, `members`, `namelist`, `trophies`, `activities`, `notifications`, `users`, `groups`, etc.
     format: ExportFormat  # `json`, `csv`, `xlsx`, etc.
     start: str  # ISO 8601 date
     end: str  # ISO 8601 date
@@ -34,3 +37,4 @@ class ExportResponse(BaseModel):
     data: Any
     format: ExportFormat
     error: Optional[str]
+    progress: float  # 0 to 1
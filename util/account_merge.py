@@ -0,0 +1,120 @@
+from bson import ObjectId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection
+
+from database import db
+from util.user_time import refresh_user_time, time_cache
+
+# Documents rewritten by one update
+chunk_size = 500
+
+
+async def _update_chunks(
+    collection: AsyncIOMotorCollection,
+    match: dict,
+    update: dict,
+    session: AsyncIOMotorClientSession,
+    array_filters: list[dict] | None = None,
+) -> int:
+    """
+    Apply `update` to documents matching `match`, `chunk_size` ids at a time
+    """
+    ids = [
+        document["_id"]
+        async for document in collection.find(match, {"_id": True}, session=session)
+    ]
+    modified = 0
+    for i in range(0, len(ids), chunk_size):
+        result = await collection.update_many(
+            {"_id": {"$in": ids[i : i + chunk_size]}, **match},
+            update,
+            array_filters=array_filters,
+            session=session,
+        )
+        modified += result.modified_count
+    return modified
+
+
+async def _merge_members(
+    collection: AsyncIOMotorCollection,
+    source: str,
+    target: str,
+    session: AsyncIOMotorClientSession,
+) -> dict:
+    # Where both were members, the target's entry is kept
+    dropped = await _update_chunks(
+        collection,
+        {"$and": [{"members._id": source}, {"members._id": target}]},
+        {"$pull": {"members": {"_id": source}}},
+        session,
+    )
+    rewritten = await _update_chunks(
+        collection,
+        {"members._id": source},
+        {"$set": {"members.$[member]._id": target}},
+        session,
+        [{"member._id": source}],
+    )
+    creator = await _update_chunks(
+        collection, {"creator": source}, {"$set": {"creator": target}}, session
+    )
+    return {"members": rewritten, "duplicates": dropped, "creator": creator}
+
+
+async def merge_users(source: str, target: str) -> dict:
+    """
+    Fold the account `source` into `target` in one transaction,
+    returns the number of documents rewritten in each collection
+    """
+    if source == target:
+        raise HTTPException(status_code=400, detail="Cannot merge a user into itself")
+    users = await db.zvms.users.find(
+        {"_id": {"$in": [ObjectId(source), ObjectId(target)]}}
+    ).to_list(None)
+    if len(users) != 2:
+        raise HTTPException(status_code=404, detail="User not found")
+    source_user = next(user for user in users if str(user["_id"]) == source)
+
+    async with await db.client.start_session() as session:
+        async with session.start_transaction():
+            activities = await _merge_members(
+                db.zvms.activities, source, target, session
+            )
+            trophies = await _merge_members(db.zvms.trophies, source, target, session)
+
+            await _update_chunks(
+                db.zvms.notifications,
+                {"$and": [{"receivers": source}, {"receivers": target}]},
+                {"$pull": {"receivers": source}},
+                session,
+            )
+            receivers = await _update_chunks(
+                db.zvms.notifications,
+                {"receivers": source},
+                {"$set": {"receivers.$[receiver]": target}},
+                session,
+                [{"receiver": source}],
+            )
+            publisher = await _update_chunks(
+                db.zvms.notifications,
+                {"publisher": source},
+                {"$set": {"publisher": target}},
+                session,
+            )
+
+            await db.zvms.users.update_one(
+                {"_id": ObjectId(target)},
+                {"$addToSet": {"group": {"$each": source_user.get("group", [])}}},
+                session=session,
+            )
+            await db.zvms.users.delete_one({"_id": ObjectId(source)}, session=session)
+            await db.zvms.user_time.delete_one({"_id": source}, session=session)
+
+    time_cache.invalidate(source)
+    await refresh_user_time([target])
+
+    return {
+        "activities": activities,
+        "trophies": trophies,
+        "notifications": {"receivers": receivers, "publisher": publisher},
+    }
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+
+from fastapi.responses import FileResponse, StreamingResponse
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument
+
+import settings
+from database import db
+
+# Folder of stored artifacts and of files being generated
+artifact_folder = os.path.join("exports", "artifacts")
+# How long an artifact is served before it is generated again
+artifact_ttl = timedelta(hours=24)
+# Seconds between two sweeps of expired artifacts
+sweep_interval = 600
+
+
+async def data_version() -> int:
+    """
+    Marker of the data exports are generated from, bumped when it changes
+    """
+    meta = await db.zvms.meta.find_one({"_id": "dataVersion"})
+    return meta["version"] if meta is not None else 0
+
+
+async def bump_data_version():
+    await db.zvms.meta.update_one(
+        {"_id": "dataVersion"}, {"$inc": {"version": 1}}, upsert=True
+    )
+
+
+def artifact_key(params: dict, version: int) -> str:
+    """
+    Content address of an export, same parameters and data give the same key
+    """
+    content = json.dumps(
+        {"params": params, "version": version}, sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class LocalBackend:
+    """
+    Files named by key, replacing a file is atomic so the key is the file
+    """
+
+    def path(self, file: str) -> str:
+        return os.path.join(artifact_folder, file)
+
+    async def put(self, key: str, source: str) -> str:
+        await asyncio.to_thread(os.replace, source, self.path(key))
+        return key
+
+    async def response(self, file: str, media_type: str, filename: str):
+        return FileResponse(self.path(file), media_type=media_type, filename=filename)
+
+    async def delete(self, file: str):
+        if os.path.exists(self.path(file)):
+            await asyncio.to_thread(os.remove, self.path(file))
+
+
+class GridFSBackend:
+    """
+    Files under fresh ids, an expired but unswept artifact or a concurrent
+    job may still hold a file of the same key
+    """
+
+    def bucket(self) -> AsyncIOMotorGridFSBucket:
+        return AsyncIOMotorGridFSBucket(db.zvms, bucket_name="artifact_files")
+
+    async def put(self, key: str, source: str):
+        with open(source, "rb") as file:
+            file_id = await self.bucket().upload_from_stream(key, file)
+        os.remove(source)
+        return file_id
+
+    async def response(self, file, media_type: str, filename: str):
+        stream = await self.bucket().open_download_stream(file)
+
+        async def chunks():
+            while chunk := await stream.readchunk():
+                yield chunk
+
+        return StreamingResponse(
+            content=chunks(),
+            media_type=media_type,
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+
+    async def delete(self, file):
+        try:
+            await self.bucket().delete(file)
+        except NoFile:
+            pass
+
+
+class ArtifactStore:
+    """
+    Generated exports by content address, records in the `artifacts` collection
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.sweeper: Optional[asyncio.Task] = None
+
+    def staging_path(self, format: str) -> str:
+        """
+        Path to generate a file at before it is stored
+        """
+        return os.path.join(artifact_folder, f"staging-{uuid.uuid4().hex}.{format}")
+
+    async def find(self, key: str) -> Optional[dict]:
+        return await db.zvms.artifacts.find_one(
+            {"_id": key, "expiresAt": {"$gt": datetime.now()}}
+        )
+
+    async def put(self, key: str, source: str, format: str):
+        size = os.path.getsize(source)
+        file = await self.backend.put(key, source)
+        now = datetime.now()
+        previous = await db.zvms.artifacts.find_one_and_update(
+            {"_id": key},
+            {
+                "$set": {
+                    "file": file,
+                    "format": format,
+                    "size": size,
+                    "createdAt": now,
+                    "expiresAt": now + artifact_ttl,
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        # The file replaced, records stored before files had ids name them by key
+        if previous is not None and previous.get("file", key) != file:
+            await self.backend.delete(previous.get("file", key))
+
+    async def discard(self, path: str):
+        if os.path.exists(path):
+            await asyncio.to_thread(os.remove, path)
+
+    async def response(self, key: str, media_type: str, filename: str):
+        artifact = await db.zvms.artifacts.find_one({"_id": key}, {"file": True})
+        file = artifact.get("file", key) if artifact is not None else key
+        return await self.backend.response(file, media_type, filename)
+
+    async def tee(
+        self, key: str, chunks: AsyncIterator[str], format: str
+    ) -> AsyncIterator[str]:
+        """
+        Pass text chunks through while storing them, the artifact is only
+        stored when every chunk was written
+        """
+        path = self.staging_path(format)
+        try:
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                async for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+        except BaseException:
+            await self.discard(path)
+            raise
+        await self.put(key, path, format)
+
+    async def sweep(self):
+        async for artifact in db.zvms.artifacts.find(
+            {"expiresAt": {"$lte": datetime.now()}}, {"file": True}
+        ):
+            # Only delete the record still naming this file, it may be replaced meanwhile
+            result = await db.zvms.artifacts.delete_one(
+                {"_id": artifact["_id"], "expiresAt": {"$lte": datetime.now()}}
+            )
+            if result.deleted_count:
+                await self.backend.delete(artifact.get("file", artifact["_id"]))
+        # Files left by generation interrupted by a restart
+        deadline = time.time() - artifact_ttl.total_seconds()
+        for name in os.listdir(artifact_folder):
+            path = os.path.join(artifact_folder, name)
+            if name.startswith("staging-") and os.path.getmtime(path) < deadline:
+                await self.discard(path)
+
+    async def _sweep_forever(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logging.exception("Artifact sweep failed")
+            await asyncio.sleep(sweep_interval)
+
+
+backends = {"local": LocalBackend, "gridfs": GridFSBackend}
+
+store = ArtifactStore(backends[getattr(settings, "ARTIFACT_STORAGE", "local")]())
+
+
+async def start_artifact_sweeper():
+    logging.info("Starting artifact sweeper...")
+    os.makedirs(artifact_folder, exist_ok=True)
+    store.sweeper = asyncio.create_task(store._sweep_forever())
+    logging.info("started artifact sweeper")
+
+
+async def stop_artifact_sweeper():
+    logging.info("stopping artifact sweeper...")
+    if store.sweeper is not None:
+        store.sweeper.cancel()
+    logging.info("stopped artifact sweeper")
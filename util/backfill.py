@@ -0,0 +1,40 @@
+from pymongo import UpdateOne
+
+from database import db
+from utils import parse_iso_date
+
+# Parsed datetime field of each collection and the ISO string it comes from
+date_fields = {
+    "activities": ("date", "dateAt"),
+    "trophies": ("time", "timeAt"),
+}
+
+
+async def backfill_dates(batch_size: int = 1000) -> dict[str, int]:
+    """
+    Fill parsed date fields of documents which don't have them yet,
+    unparsable dates are stored as None so they are not scanned again
+    """
+    result = {}
+    for collection, (source, target) in date_fields.items():
+        count = 0
+        operations = []
+        cursor = db.zvms[collection].find(
+            {target: {"$exists": False}}, {source: True}, batch_size=batch_size
+        )
+        async for document in cursor:
+            operations.append(
+                UpdateOne(
+                    {"_id": document["_id"]},
+                    {"$set": {target: parse_iso_date(document.get(source))}},
+                )
+            )
+            if len(operations) >= batch_size:
+                await db.zvms[collection].bulk_write(operations, ordered=False)
+                count += len(operations)
+                operations = []
+        if operations:
+            await db.zvms[collection].bulk_write(operations, ordered=False)
+            count += len(operations)
+        result[collection] = count
+    return result
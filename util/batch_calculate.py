@@ -0,0 +1,171 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from database import db
+from util.calculate import (
+    combine_time,
+    date_match,
+    summarize_awards,
+    summarize_durations,
+)
+
+
+def _member_filter(users: Optional[list[str]], effective: bool) -> dict:
+    conditions = []
+    if users is not None:
+        conditions.append({"$in": ["$$member._id", users]})
+    if effective:
+        conditions.append({"$eq": ["$$member.status", "effective"]})
+    if not conditions:
+        return "$members"
+    return {
+        "$filter": {
+            "input": "$members",
+            "as": "member",
+            "cond": {"$and": conditions},
+        }
+    }
+
+
+def _pipeline(
+    match: dict, users: Optional[list[str]], effective: bool, extra: dict = {}
+) -> list[dict]:
+    if users is not None:
+        match = {**match, "members._id": {"$in": users}}
+    return [
+        {"$match": match},
+        {"$project": {"members": _member_filter(users, effective), **extra}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def category_pipelines(
+    users: Optional[list[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> dict[str, tuple]:
+    """
+    Collection and pipeline of each time category, mirroring `calculate_time`
+    """
+    activity_dates = date_match("dateAt", start, end)
+    return {
+        "normal": (
+            db.zvms.activities,
+            _pipeline(
+                {
+                    "status": "effective",
+                    "members.status": "effective",
+                    "type": {"$ne": "special"},
+                    **activity_dates,
+                },
+                users,
+                effective=True,
+            ),
+        ),
+        "special": (
+            db.zvms.activities,
+            _pipeline(
+                {
+                    "type": "special",
+                    "status": "effective",
+                    "members.status": "effective",
+                    "special.classify": {"$ne": "prize"},
+                    **activity_dates,
+                },
+                users,
+                effective=False,
+            ),
+        ),
+        "prize": (
+            db.zvms.activities,
+            _pipeline(
+                {"type": "special", "special.classify": "prize", **activity_dates},
+                users,
+                effective=False,
+            ),
+        ),
+        "trophy": (
+            db.zvms.trophies,
+            _pipeline(
+                date_match("timeAt", start, end),
+                users,
+                effective=True,
+                extra={"awards": True, "award": True},
+            ),
+        ),
+    }
+
+
+async def stream_first_members(collection, pipeline: list[dict]):
+    """
+    Stream documents and yield the first matched member of each user per document,
+    the same member `calculate_time` picks with `members[0]` after filtering.
+    """
+    async for document in collection.aggregate(pipeline):
+        seen = set()
+        for member in document.get("members") or []:
+            if member["_id"] in seen:
+                continue
+            seen.add(member["_id"])
+            yield document, member
+
+
+async def _group_members(
+    collection, pipeline: list[dict], keep_document: bool = False
+) -> dict[str, list[dict]]:
+    grouped: dict[str, list[dict]] = {}
+    async for document, member in stream_first_members(collection, pipeline):
+        if keep_document:
+            entry = {
+                "members": [member],
+                "awards": document.get("awards", []),
+                "award": document.get("award"),
+            }
+        else:
+            entry = member
+        grouped.setdefault(member["_id"], []).append(entry)
+    return grouped
+
+
+async def calculate_time_batch(
+    users: Optional[list[str]] = None,
+    prize_full: float = 10.0,
+    discount: bool = False,
+    discount_rate: float = 1 / 3,
+    discount_full: float = 6.0,
+    discount_base: float = 30.0,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> dict[str, dict[str, float]]:
+    """
+    Calculate time of many users with one aggregation per category,
+    returns results identical to `calculate_time` keyed by user oid.
+    If `users` is None, every user who appears in any member list is calculated.
+    """
+    pipelines = category_pipelines(users, start, end)
+    normal, special, prize, trophies = await asyncio.gather(
+        *[
+            _group_members(collection, pipeline, keep_document=kind == "trophy")
+            for kind, (collection, pipeline) in pipelines.items()
+        ]
+    )
+
+    if users is None:
+        users = list(set(normal) | set(special) | set(prize) | set(trophies))
+
+    result = {}
+    for user in users:
+        awards = summarize_awards(
+            prize.get(user, []), trophies.get(user, []), prize_full
+        )
+        result[user] = combine_time(
+            awards,
+            summarize_durations(normal.get(user, [])),
+            summarize_durations(special.get(user, [])),
+            discount,
+            discount_rate,
+            discount_full,
+            discount_base,
+        )
+    return result
@@ -0,0 +1,119 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+def _sizeof(value: Any) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_sizeof(item) for item in value)
+    return size
+
+
+class LRUCache:
+    """
+    Least recently used cache bounded by entry count and approximate memory,
+    with hit/miss counters, per-key versions for invalidation and optional
+    expiry times
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.expiries: dict[Hashable, float] = {}
+        # Clock of the last invalidation of each key, oldest first. Beyond
+        # `max_entries` the oldest are dropped and `floor` stands in for them.
+        self.versions: OrderedDict[Hashable, int] = OrderedDict()
+        self.clock = 0
+        self.floor = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key in self.expiries and self.expiries[key] <= time.time():
+            self._remove(key)
+            self.expirations += 1
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return self.entries[key][0]
+
+    def version(self, key: Hashable) -> int:
+        """
+        Version to pass to `put` when the value is computed after reading it
+        """
+        return self.clock
+
+    def _invalidated_at(self, key: Hashable) -> int:
+        return self.versions.get(key, self.floor)
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        version: Optional[int] = None,
+        expires_at: Optional[float] = None,
+    ):
+        """
+        Store `value`, until the epoch time `expires_at` if given
+        """
+        # The key was invalidated while the value was computed, it may be stale
+        if version is not None and version < self._invalidated_at(key):
+            return
+        self._remove(key)
+        size = _sizeof(key) + _sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        if expires_at is not None:
+            self.expiries[key] = expires_at
+        self.bytes += size
+        while len(self.entries) > self.max_entries or (
+            self.max_bytes is not None and self.bytes > self.max_bytes
+        ):
+            evicted_key, (_, evicted) = self.entries.popitem(last=False)
+            self.expiries.pop(evicted_key, None)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self.clock += 1
+        self.versions.pop(key, None)
+        self.versions[key] = self.clock
+        # Values computed before a dropped clock are refused, as if invalidated
+        while len(self.versions) > self.max_entries:
+            _, clock = self.versions.popitem(last=False)
+            self.floor = max(self.floor, clock)
+        self._remove(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.expiries.clear()
+        self.bytes = 0
+
+    def _remove(self, key: Hashable):
+        self.expiries.pop(key, None)
+        if key in self.entries:
+            _, size = self.entries.pop(key)
+            self.bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,3 +1,5 @@
+import asyncio
+from datetime import datetime
 from typing import Optional
 from unittest import result
 
@@ -6,18 +8,153 @@ from database import db
 from util.get_class import get_user_classname
 
 
-async def calculate_awards(
-    user: str,
-    trophies: list[dict] = [],
-    activities: list[dict] = [],
-    full: float = 10.0,
+def summarize_durations(members: list[dict]) -> dict[str, float]:
+    """
+    Sum durations of activity members by mode, one member per activity
+    """
+    result = {
+        "on-campus": 0.0,
+        "off-campus": 0.0,
+        "social-practice": 0.0,
+    }
+    for member in members:
+        if member["mode"] == "on-campus":
+            result["on-campus"] += member["duration"]
+        elif member["mode"] == "off-campus":
+            result["off-campus"] += member["duration"]
+        else:
+            result["social-practice"] += member["duration"]
+    return result
+
+
+def summarize_awards(
+    prize_members: list[dict], trophies: list[dict], full: float = 10.0
 ) -> dict[str, float]:
-    # Read trophy list with `members` field (array) containing user's id (._id field in members)
+    """
+    Apply the prize time limit to prize activity members and trophies.
+    Each trophy carries `awards`, `award` and the user's `members` entries.
+    """
+    awards = {
+        "on-campus": 0.0,
+        "off-campus": 0.0,
+        "total": 0.0,
+    }
+    for member in prize_members:
+        if member["mode"] == "on-campus":
+            awards["on-campus"] += member["duration"]
+        elif member["mode"] == "off-campus":
+            awards["off-campus"] += member["duration"]
+        awards["total"] += member["duration"]
+
+    if awards["total"] >= full:
+        # Average the duration of recorded time as time limit is reached
+        awards["on-campus"] = round(awards["on-campus"] / awards["total"] * full, 1)
+        awards["off-campus"] = full - awards["on-campus"]
+        awards["total"] = full
+        return awards
+
+    # Calculate awards
+    for trophy in trophies:
+        if len(trophy["members"]) == 0:
+            continue
+        member = trophy["members"][0]
+        award_name = trophy["award"]
+        for award in trophy["awards"]:
+            if award["name"] == award_name:
+                flag_ = False
+                duration = award["duration"]
+                if awards["total"] + award["duration"] > full:
+                    duration = full - awards["total"]
+                    flag_ = True
+                if member["mode"] == "on-campus":
+                    awards["on-campus"] += duration
+                elif member["mode"] == "off-campus":
+                    awards["off-campus"] += duration
+                else:
+                    break
+                if flag_:
+                    return awards
+                awards["total"] += award["duration"]
+                break
+    return awards
+
 
-    inject_trophies = [
+def combine_time(
+    awards: dict[str, float],
+    normal: dict[str, float],
+    special: dict[str, float],
+    discount: bool = False,
+    discount_rate: float = 1 / 3,
+    discount_full: float = 6.0,
+    discount_base: float = 30.0,
+) -> dict[str, float]:
+    """
+    Merge awards, normal and special activity sums into the final time result
+    """
+    result = {
+        "on-campus": 0.0,
+        "off-campus": 0.0,
+        "social-practice": 0.0,
+        "trophy": 0.0,
+        "total": 0.0,
+    }
+    result["on-campus"] = awards["on-campus"]
+    result["off-campus"] = awards["off-campus"]
+    result["total"] = awards["total"]
+    result["trophy"] = awards["total"]
+    result["on-campus"] += normal["on-campus"]
+    result["off-campus"] += normal["off-campus"]
+    result["social-practice"] += normal["social-practice"]
+    result["total"] += (
+        normal["on-campus"] + normal["off-campus"] + normal["social-practice"]
+    )
+    result["on-campus"] += special["on-campus"]
+    result["off-campus"] += special["off-campus"]
+    result["social-practice"] += special["social-practice"]
+    result["total"] += (
+        special["on-campus"] + special["off-campus"] + special["social-practice"]
+    )
+    result["on-campus"] = round(result["on-campus"], 1)
+    result["off-campus"] = round(result["off-campus"], 1)
+    if discount:
+        if result["on-campus"] > discount_base:
+            discount_duration = round(
+                (result["on-campus"] - discount_base) * discount_rate, 1
+            )
+            if discount_duration > discount_full:
+                discount_duration = discount_full
+            result["off-campus"] += discount_duration
+    result["social-practice"] = round(result["social-practice"], 1)
+    result["trophy"] = round(result["trophy"], 1)
+    result["total"] = round(result["total"], 1)
+    return result
+
+
+def date_match(
+    field: str, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> dict:
+    """
+    Match documents whose parsed date `field` is in [start, end)
+    """
+    condition = {}
+    if start is not None:
+        condition["$gte"] = start
+    if end is not None:
+        condition["$lt"] = end
+    return {field: condition} if condition else {}
+
+
+def trophies_pipeline(
+    user: str, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> list[dict]:
+    """
+    Trophies of the user, keeping only the user's effective members
+    """
+    return [
         {
             "$match": {
                 "members._id": user,
+                **date_match("timeAt", start, end),
             }
         },
         {
@@ -38,8 +175,22 @@ async def calculate_awards(
                 "award": True,
             }
         },
+        {"$sort": {"_id": 1}},
     ]
 
+
+async def calculate_awards(
+    user: str,
+    trophies: list[dict] = [],
+    activities: list[dict] = [],
+    full: float = 10.0,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> dict[str, float]:
+    # Read trophy list with `members` field (array) containing user's id (._id field in members)
+
+    inject_trophies = trophies_pipeline(user, start, end)
+
     trophies = await db.zvms.trophies.aggregate(inject_trophies).to_list(None)
 
     inject_activities = [
@@ -48,6 +199,7 @@ async def calculate_awards(
                 "members._id": user,
                 "type": "special",
                 "special.classify": "prize",
+                **date_match("dateAt", start, end),
             }
         },
         {
@@ -64,57 +216,18 @@ async def calculate_awards(
     ]
     activities = await db.zvms.activities.aggregate(inject_activities).to_list(None)
 
-    awards = {
-        "on-campus": 0.0,
-        "off-campus": 0.0,
-        "total": 0.0,
-    }
-    for activity in activities:
-        if len(activity["members"]) == 0:
-            continue
-        member = activity["members"][0]
-        if member["_id"] == user:
-            if member["mode"] == "on-campus":
-                awards["on-campus"] += member["duration"]
-            elif member["mode"] == "off-campus":
-                awards["off-campus"] += member["duration"]
-            awards["total"] += member["duration"]
-
-    if awards["total"] >= full:
-        # Average the duration of recorded time as time limit is reached
-        awards["on-campus"] = round(awards["on-campus"] / awards["total"] * full, 1)
-        awards["off-campus"] = full - awards["on-campus"]
-        awards["total"] = full
-        return awards
-
-    # Calculate awards
-    for trophy in trophies:
-        if len(trophy["members"]) == 0:
-            continue
-        member = trophy["members"][0]
-        award_name = trophy["award"]
-        for award in trophy["awards"]:
-            if award["name"] == award_name:
-                flag_ = False
-                duration = award["duration"]
-                if awards["total"] + award["duration"] > full:
-                    duration = full - awards["total"]
-                    flag_ = True
-                if member["mode"] == "on-campus":
-                    awards["on-campus"] += duration
-                elif member["mode"] == "off-campus":
-                    awards["off-campus"] += duration
-                else:
-                    break
-                if flag_:
-                    return awards
-                awards["total"] += award["duration"]
-                break
-    return awards
+    return summarize_awards(
+        [activity["members"][0] for activity in activities if activity["members"]],
+        trophies,
+        full,
+    )
 
 
 async def calculate_special_activities(
-    user: str, activities: Optional[list[dict]] = []
+    user: str,
+    activities: Optional[list[dict]] = [],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
 ) -> dict[str, float]:
     # Read user's activity list
     inject = [
@@ -125,6 +238,7 @@ async def calculate_special_activities(
                 "status": "effective",
                 "members.status": "effective",
                 "special.classify": {"$ne": "prize"},
+                **date_match("dateAt", start, end),
             }
         },
         {
@@ -141,31 +255,16 @@ async def calculate_special_activities(
     ]
     activities = await db.zvms.activities.aggregate(inject).to_list(None)
 
-    result = {
-        "on-campus": 0.0,
-        "off-campus": 0.0,
-        "social-practice": 0.0,
-    }
-
-    if activities is None:
-        return result
-
-    for activity in activities:
-        if len(activity["members"]) == 0:
-            continue
-        member = activity["members"][0]
-        if member["mode"] == "on-campus":
-            result["on-campus"] += member["duration"]
-        elif member["mode"] == "off-campus":
-            result["off-campus"] += member["duration"]
-        else:
-            result["social-practice"] += member["duration"]
-
-    return result
+    return summarize_durations(
+        [activity["members"][0] for activity in activities if activity["members"]]
+    )
 
 
 async def calculate_normal_activities(
-    user: str, activities: Optional[list[dict]] = []
+    user: str,
+    activities: Optional[list[dict]] = [],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
 ) -> dict[str, float]:
     # Read user's activity list
 
@@ -176,6 +275,7 @@ async def calculate_normal_activities(
                 "status": "effective",
                 "members.status": "effective",
                 "type": {"$ne": "special"},
+                **date_match("dateAt", start, end),
             }
         },
         {
@@ -197,27 +297,9 @@ async def calculate_normal_activities(
     ]
     activities = await db.zvms.activities.aggregate(inject).to_list(None)
 
-    result = {
-        "on-campus": 0.0,
-        "off-campus": 0.0,
-        "social-practice": 0.0,
-    }
-
-    if activities is None:
-        return result
-
-    for activity in activities:
-        if len(activity["members"]) == 0:
-            continue
-        member = activity["members"][0]
-        if member["mode"] == "on-campus":
-            result["on-campus"] += member["duration"]
-        elif member["mode"] == "off-campus":
-            result["off-campus"] += member["duration"]
-        else:
-            result["social-practice"] += member["duration"]
-
-    return result
+    return summarize_durations(
+        [activity["members"][0] for activity in activities if activity["members"]]
+    )
 
 
 async def calculate_time(
@@ -231,44 +313,114 @@ async def calculate_time(
     discount_rate: float = 1 / 3,
     discount_full: float = 6.0,  # if `on-campus` is full, can be used to calculate `off-campus` time with 1/3 exceeded time (rounded to 1 decimal place)
     discount_base: float = 30.0,  # if `on-campus` is full, can be used to calculate `off-campus` time with 1/3 exceeded time (rounded to 1 decimal place)
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
 ) -> dict[str, float]:
-    result = {
-        "on-campus": 0.0,
-        "off-campus": 0.0,
-        "social-practice": 0.0,
-        "trophy": 0.0,
-        "total": 0.0,
+    trophy = await calculate_awards(user, full=prize_full, start=start, end=end)
+    normal = await calculate_normal_activities(user, start=start, end=end)
+    special = await calculate_special_activities(user, start=start, end=end)
+    return combine_time(
+        trophy,
+        normal,
+        special,
+        discount,
+        discount_rate,
+        discount_full,
+        discount_base,
+    )
+
+
+def _first_member(user: str, effective: bool) -> dict:
+    cond = {"$eq": ["$$member._id", user]}
+    if effective:
+        cond = {"$and": [cond, {"$eq": ["$$member.status", "effective"]}]}
+    return {
+        "$arrayElemAt": [
+            {"$filter": {"input": "$members", "as": "member", "cond": cond}},
+            0,
+        ]
     }
-    trophy = await calculate_awards(user)
-    result["on-campus"] = trophy["on-campus"]
-    result["off-campus"] = trophy["off-campus"]
-    result["total"] = trophy["total"]
-    result["trophy"] = trophy["total"]
-    normal = await calculate_normal_activities(user)
-    result["on-campus"] += normal["on-campus"]
-    result["off-campus"] += normal["off-campus"]
-    result["social-practice"] += normal["social-practice"]
-    result["total"] += (
-        normal["on-campus"] + normal["off-campus"] + normal["social-practice"]
+
+
+def _sum_by_mode(match: dict, user: str, effective: bool) -> list[dict]:
+    return [
+        {"$match": match},
+        {"$project": {"member": _first_member(user, effective)}},
+        {"$match": {"member": {"$exists": True}}},
+        {
+            "$group": {
+                "_id": "$member.mode",
+                "duration": {"$sum": "$member.duration"},
+            }
+        },
+    ]
+
+
+async def calculate_time_combined(
+    user: str,
+    prize_full: float = 10.0,
+    discount: bool = False,
+    discount_rate: float = 1 / 3,
+    discount_full: float = 6.0,
+    discount_base: float = 30.0,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> dict[str, float]:
+    """
+    Same as `calculate_time`, but sums normal, special and prize activities
+    in one `$facet` aggregation while trophies are read concurrently
+    """
+    inject = [
+        {"$match": {"members._id": user, **date_match("dateAt", start, end)}},
+        {
+            "$facet": {
+                "normal": _sum_by_mode(
+                    {
+                        "status": "effective",
+                        "members.status": "effective",
+                        "type": {"$ne": "special"},
+                    },
+                    user,
+                    effective=True,
+                ),
+                "special": _sum_by_mode(
+                    {
+                        "type": "special",
+                        "status": "effective",
+                        "members.status": "effective",
+                        "special.classify": {"$ne": "prize"},
+                    },
+                    user,
+                    effective=False,
+                ),
+                "prize": _sum_by_mode(
+                    {"type": "special", "special.classify": "prize"},
+                    user,
+                    effective=False,
+                ),
+            }
+        },
+    ]
+    activities, trophies = await asyncio.gather(
+        db.zvms.activities.aggregate(inject).to_list(None),
+        db.zvms.trophies.aggregate(trophies_pipeline(user, start, end)).to_list(
+            None
+        ),
     )
-    special = await calculate_special_activities(user)
-    result["on-campus"] += special["on-campus"]
-    result["off-campus"] += special["off-campus"]
-    result["social-practice"] += special["social-practice"]
-    result["total"] += (
-        special["on-campus"] + special["off-campus"] + special["social-practice"]
+    # Each group stands for the summed members of one mode
+    sums = {
+        key: [
+            {"mode": group["_id"], "duration": group["duration"]} for group in groups
+        ]
+        for key, groups in activities[0].items()
+    }
+    awards = summarize_awards(sums["prize"], trophies, prize_full)
+    return combine_time(
+        awards,
+        summarize_durations(sums["normal"]),
+        summarize_durations(sums["special"]),
+        discount,
+        discount_rate,
+        discount_full,
+        discount_base,
     )
-    result["on-campus"] = round(result["on-campus"], 1)
-    result["off-campus"] = round(result["off-campus"], 1)
-    if discount:
-        if result["on-campus"] > discount_base:
-            discount_duration = round(
-                (result["on-campus"] - discount_base) * discount_rate, 1
-            )
-            if discount_duration > discount_full:
-                discount_duration = discount_full
-            result["off-campus"] += discount_duration
-    result["social-practice"] = round(result["social-practice"], 1)
-    result["trophy"] = round(result["trophy"], 1)
-    result["total"] = round(result["total"], 1)
-    return result
@@ -11,6 +11,8 @@ from bson import ObjectId
 from bcrypt import checkpw, gensalt, hashpw
 from Crypto.Hash import SHA256
 
+from util.cache import LRUCache
+from util.crypto_pool import crypto_pool
 from util.group import get_user_permissions
 
 
@@ -19,6 +21,11 @@ class Auth:
     time: int
 
 
+# User oids by login id (student number), kept for `user_oid_ttl` seconds
+user_oid_cache = LRUCache(max_entries=16384)
+user_oid_ttl = 600
+
+
 def hash_password(password):
     return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
 
@@ -74,28 +81,62 @@ def jwt_decode(token):
 
 
 async def get_renewed_password(id: str, credential: str):
-    field = json.loads(rsa_decrypt(credential))
+    field = json.loads(await crypto_pool.run(rsa_decrypt, credential))
     time = field["time"]
     if time < datetime.datetime.now().timestamp() - 60:
         raise HTTPException(status_code=401, detail="Token expired")
-    new_password = hashpw(bytes(field["password"], "utf-8"), gensalt())
+    new_password = await crypto_pool.run(
+        hashpw, bytes(field["password"], "utf-8"), gensalt()
+    )
     await db.zvms.users.update_one(
         {"_id": ObjectId(id)}, {"$set": {"password": new_password}}
     )
 
 
-async def validate_by_cert(id: str, cert: str, type: Optional[str] = "long"):
-    auth_field = json.loads(rsa_decrypt(cert))
+async def find_login_user(id: str) -> dict:
+    """
+    User logging in by oid or login id, read once
+    """
+    oid = id if ObjectId.is_valid(id) else user_oid_cache.get(id)
+    if oid is not None:
+        user = await db.zvms.users.find_one({"_id": ObjectId(oid)})
+        if user is not None and (oid == id or user["id"] == id):
+            return user
+        if oid == id:
+            raise HTTPException(status_code=404, detail="User not found")
+        # The cached user was changed or merged meanwhile
+        user_oid_cache.invalidate(id)
+
+    users = await db.zvms.users.find({"id": id}).to_list(2)
+    if len(users) != 1:
+        raise HTTPException(
+            status_code=404,
+            detail="The id of the user is not found, or there are multiple users with the same id.",
+        )
+    user_oid_cache.put(
+        id,
+        str(users[0]["_id"]),
+        expires_at=datetime.datetime.now().timestamp() + user_oid_ttl,
+    )
+    return users[0]
+
+
+async def validate_by_cert(
+    id: str, cert: str, type: Optional[str] = "long", user: Optional[dict] = None
+):
+    auth_field = json.loads(await crypto_pool.run(rsa_decrypt, cert))
     time = auth_field["time"]
     # in a minute
     if time < datetime.datetime.now().timestamp() - 60:
         raise HTTPException(status_code=401, detail="Token expired")
-    founded = await db.zvms.users.find({"_id": ObjectId(id)}).to_list(None)
-    if len(founded) == 0:
+    if user is None:
+        user = await db.zvms.users.find_one({"_id": ObjectId(id)})
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    user = founded[0]
-    if checkpw(
-        bytes(auth_field["password"], "utf-8"), bytes(user["password"], "utf-8")
+    if await crypto_pool.run(
+        checkpw,
+        bytes(auth_field["password"], "utf-8"),
+        bytes(user["password"], "utf-8"),
     ):
         return jwt_encode(id, await get_user_permissions(user), type=type)
     else:
@@ -103,17 +144,20 @@ async def validate_by_cert(id: str, cert: str, type: Optional[str] = "long"):
 
 
 async def get_hashed_password_by_cert(cert: str):
-    auth_field = json.loads(rsa_decrypt(cert))
+    auth_field = json.loads(await crypto_pool.run(rsa_decrypt, cert))
     time = auth_field["time"]
     # in a minute
     if time < datetime.datetime.now().timestamp() - 60:
         raise HTTPException(status_code=401, detail="Token expired")
     password = auth_field["password"]
-    return hashpw(bytes(password, "utf-8"), gensalt()).decode("utf-8")
+    hashed = await crypto_pool.run(hashpw, bytes(password, "utf-8"), gensalt())
+    return hashed.decode("utf-8")
 
 
 async def checkpwd(id: str, pwd: str):
     user = await db.zvms.users.find_one({"_id": ObjectId(id)})
-    if checkpw(bytes(pwd, "utf-8"), bytes(user["password"], "utf-8")):
+    if await crypto_pool.run(
+        checkpw, bytes(pwd, "utf-8"), bytes(user["password"], "utf-8")
+    ):
         return True
     return False
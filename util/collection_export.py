@@ -0,0 +1,192 @@
+import csv
+import json
+from datetime import datetime
+from io import StringIO
+from typing import AsyncIterator
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from database import db
+from typings.export import Export
+from utils import validate_date, validate_object_id
+
+# Collections open to generic export. `filters` maps each field clients may
+# filter on to the type of its values, every one of them is indexed in
+# `create_indexes` so an export never scans a whole collection. `date` is
+# the parsed date field `start` and `end` apply to, `fields` the exported
+# columns, which also keeps credentials out of exports.
+exportable = {
+    "activities": {
+        "date": "dateAt",
+        "filters": {"members._id": str, "type": str, "status": str, "creator": str},
+        "fields": [
+            "_id",
+            "name",
+            "type",
+            "status",
+            "date",
+            "creator",
+            "members",
+            "special",
+            "createdAt",
+        ],
+    },
+    "trophies": {
+        "date": "timeAt",
+        "filters": {"members._id": str, "status": str, "creator": str},
+        "fields": [
+            "_id",
+            "name",
+            "type",
+            "level",
+            "status",
+            "time",
+            "creator",
+            "instructor",
+            "awards",
+            "members",
+            "createdAt",
+        ],
+    },
+    "notifications": {
+        "date": None,
+        "filters": {"publisher": str, "type": str},
+        "fields": [
+            "_id",
+            "title",
+            "content",
+            "time",
+            "publisher",
+            "type",
+            "global",
+            "receivers",
+            "expire",
+        ],
+    },
+    "users": {
+        "date": None,
+        "filters": {"id": str, "group": str},
+        "fields": ["_id", "id", "name", "sex", "group"],
+    },
+    "groups": {
+        "date": None,
+        "filters": {"type": str},
+        "fields": ["_id", "name", "type", "description", "permissions"],
+    },
+}
+
+
+def _cast(field: str, cast: type, value: str):
+    if field == "_id":
+        return validate_object_id(value)
+    try:
+        return cast(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid value of {field}")
+
+
+def build_query(export: Export) -> dict:
+    """
+    Turn an export into a Mongo query, arguments are checked against `exportable`
+    """
+    spec = exportable.get(export.collection)
+    if spec is None:
+        raise HTTPException(status_code=400, detail="Unsupported export collection")
+
+    match = {}
+    for field, value in (export.filters or {}).items():
+        if field != "_id" and field not in spec["filters"]:
+            raise HTTPException(status_code=400, detail=f"Can't filter by {field}")
+        match[field] = _cast(field, spec["filters"].get(field, str), value)
+
+    # Empty `start` or `end` leaves the range open
+    start = validate_date(export.start or None)
+    end = validate_date(export.end or None)
+    if start is not None or end is not None:
+        if spec["date"] is None:
+            raise HTTPException(status_code=400, detail="Can't filter by date")
+        match[spec["date"]] = {}
+        if start is not None:
+            match[spec["date"]]["$gte"] = start
+        if end is not None:
+            match[spec["date"]]["$lt"] = end
+
+    sort = export.sort or "_id"
+    key = sort.lstrip("-")
+    if key not in ("_id", spec["date"], *spec["filters"]):
+        raise HTTPException(status_code=400, detail=f"Can't sort by {key}")
+    if export.limit < 0 or export.offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid limit or offset")
+
+    return {
+        "filter": match,
+        "projection": {field: True for field in spec["fields"]},
+        "sort": [(key, -1 if sort.startswith("-") else 1)],
+        "skip": export.offset,
+        "limit": export.limit,
+    }
+
+
+def _plain(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _cell(value):
+    # Nested values go to a single CSV cell as JSON
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def collection_cursor(export: Export, batch_size: int = 1000):
+    """
+    Cursor of exported documents, checked before any response is started
+    """
+    if export.format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+    if not 1 <= batch_size <= 10000:
+        raise HTTPException(status_code=400, detail="Invalid batch size")
+    query = build_query(export)
+    return db.zvms[export.collection].find(
+        query["filter"],
+        query["projection"],
+        sort=query["sort"],
+        skip=query["skip"],
+        limit=query["limit"],
+        batch_size=batch_size,
+    )
+
+
+async def stream_collection(
+    cursor, collection: str, format: str
+) -> AsyncIterator[str]:
+    """
+    Render documents to NDJSON or CSV lines as they are read from the cursor
+    """
+    if format == "ndjson":
+        async for document in cursor:
+            yield json.dumps(_plain(document), ensure_ascii=False) + "\n"
+        return
+
+    fields = exportable[collection]["fields"]
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    async for document in cursor:
+        document = _plain(document)
+        writer.writerow([_cell(document.get(field)) for field in fields])
+        # Flush a batch of lines at a time
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
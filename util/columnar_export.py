@@ -0,0 +1,147 @@
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from database import db
+from util.calculate import date_match
+
+time_schema = pa.schema(
+    [
+        ("_id", pa.string()),
+        ("name", pa.string()),
+        ("id", pa.string()),
+        ("class", pa.string()),
+        ("on-campus", pa.float64()),
+        ("off-campus", pa.float64()),
+        ("social-practice", pa.float64()),
+        ("trophy", pa.float64()),
+        ("total", pa.float64()),
+    ]
+)
+
+member_schema = pa.schema(
+    [
+        ("activity", pa.string()),
+        ("name", pa.string()),
+        ("type", pa.string()),
+        ("status", pa.string()),
+        ("classify", pa.string()),
+        ("date", pa.timestamp("ms", tz="UTC")),
+        ("member", pa.string()),
+        ("memberStatus", pa.string()),
+        ("mode", pa.string()),
+        ("duration", pa.float64()),
+    ]
+)
+
+
+class ColumnarWriter:
+    """
+    Write rows to a Parquet or Arrow IPC file in record batches of `batch_size`
+    """
+
+    def __init__(
+        self, path: str, schema: pa.Schema, format: str, batch_size: int = 4096
+    ):
+        self.schema = schema
+        self.batch_size = batch_size
+        self.columns = {name: [] for name in schema.names}
+        if format == "parquet":
+            self.writer = pq.ParquetWriter(path, schema, compression="zstd")
+        elif format == "arrow":
+            self.writer = pa.ipc.new_file(path, schema)
+        else:
+            raise ValueError(f"Unsupported columnar format: {format}")
+
+    def append(self, row: dict):
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+        if len(self.columns[self.schema.names[0]]) >= self.batch_size:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    async def write_from(self, rows: AsyncIterator[dict]):
+        """
+        Append rows as they arrive, each batch is written in a thread
+        so the event loop only collects rows, then close the file
+        """
+        batch = []
+        try:
+            async for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    await asyncio.to_thread(self.extend, batch)
+                    batch = []
+            await asyncio.to_thread(self.extend, batch)
+        finally:
+            await asyncio.to_thread(self.close)
+
+    def flush(self):
+        if not self.columns[self.schema.names[0]]:
+            return
+        batch = pa.RecordBatch.from_pydict(self.columns, schema=self.schema)
+        self.writer.write_batch(batch)
+        for values in self.columns.values():
+            values.clear()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+async def write_time_columnar(records: AsyncIterator[dict], path: str, format: str):
+    """
+    Write time records as they arrive
+    """
+
+    async def rows():
+        async for record in records:
+            yield {
+                "_id": record["id"],
+                "name": record["info"]["name"],
+                "id": str(record["info"]["id"]),
+                "class": record["info"]["group"],
+                **record["time"],
+            }
+
+    await ColumnarWriter(path, time_schema, format).write_from(rows())
+
+
+async def write_members_columnar(
+    path: str,
+    format: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = 4096,
+):
+    """
+    Write one row per activity member, read from the cursor in batches
+    """
+    pipeline = [
+        {"$match": date_match("dateAt", start, end)},
+        {"$unwind": "$members"},
+        {
+            "$project": {
+                "_id": False,
+                "activity": {"$toString": "$_id"},
+                "name": True,
+                "type": True,
+                "status": True,
+                "classify": "$special.classify",
+                "date": "$dateAt",
+                "member": "$members._id",
+                "memberStatus": "$members.status",
+                "mode": "$members.mode",
+                "duration": {"$toDouble": "$members.duration"},
+            }
+        },
+    ]
+    await ColumnarWriter(path, member_schema, format, batch_size).write_from(
+        db.zvms.activities.aggregate(pipeline, batchSize=batch_size)
+    )
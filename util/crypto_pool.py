@@ -0,0 +1,76 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException
+
+
+class CryptoPool:
+    """
+    Bounded pool for RSA and bcrypt work of the credential pipeline.
+    bcrypt and pycryptodome release the GIL, so threads hash in parallel
+    without pickling arguments to other processes.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="crypto"
+        )
+        self.lock = threading.Lock()
+        self.pending = 0  # Submitted and not finished
+        self.running = 0
+        self.peak = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _call(self, function: Callable, args: tuple) -> Any:
+        with self.lock:
+            self.running += 1
+        try:
+            return function(*args)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    async def run(self, function: Callable, *args) -> Any:
+        """
+        Run `function` in the pool, 503 if too many calls are waiting already
+        """
+        if self.depth() >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, try again later",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        self.peak = max(self.peak, self.depth())
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._call, function, args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def depth(self) -> int:
+        """
+        Calls waiting for a worker
+        """
+        return max(self.pending - self.running, 0)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queueDepth": self.depth(),
+            "peakQueueDepth": self.peak,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+crypto_pool = CryptoPool(workers=os.cpu_count() or 1, max_queue=256)
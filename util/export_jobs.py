@@ -0,0 +1,271 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from database import db
+from typings.export import Export, ExportResponse, ExportStatus
+from util.artifact_store import artifact_key, data_version, store
+from util.collection_export import collection_cursor, exportable, stream_collection
+from util.columnar_export import write_members_columnar, write_time_columnar
+from util.namelist import load_namelist, write_namelist, write_namelist_csv
+from util.time_export import (
+    calculate,
+    iter_time_records,
+    stream_csv,
+    write_time_file,
+    write_xlsx,
+)
+from utils import parse_iso_date
+
+# Collections whose every change bumps the data version, so stored
+# exports of them can be served to identical requests
+versioned_collections = {"time", "namelist"}
+# Jobs exported at the same time, and worker processes rendering their files
+concurrency = 2
+
+
+class ExportWorkers:
+    queue: asyncio.Queue = None  # type: ignore
+    tasks: list[asyncio.Task] = []
+    executor: ProcessPoolExecutor = None  # type: ignore
+
+
+workers = ExportWorkers()
+
+
+async def update_job(job_id: ObjectId, **fields):
+    fields["updatedAt"] = datetime.now().isoformat()
+    await db.zvms.exports.update_one({"_id": job_id}, {"$set": fields})
+
+
+async def render(function: Callable, *args):
+    """
+    Run CPU-bound file rendering in the worker processes, off the event loop
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(workers.executor, function, *args)
+
+
+def time_users():
+    """
+    Cursor of users in a time export
+    """
+    return db.zvms.users.find({}, {"name": True, "id": True, "group": True}).sort(
+        "id", 1
+    )
+
+
+async def export_time(job: dict, path: str):
+    params = job["params"]
+    filters = params.get("filters") or {}
+    discount = filters.get("discount") == "true"
+    start = parse_iso_date(params.get("start"))
+    end = parse_iso_date(params.get("end"))
+
+    if params["format"] == "csv":
+        # Written while users are calculated, the file is never held in memory
+        total = await db.zvms.users.count_documents({})
+        count = 0
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            records = iter_time_records(time_users(), 10.0, discount, start, end)
+            async for line in stream_csv(records):
+                file.write(line)
+                count += 1
+                if count % 500 == 0:
+                    await update_job(job["_id"], progress=min(count / total, 0.99))
+        return
+
+    if params["format"] == "xlsx":
+        records = iter_time_records(time_users(), 10.0, discount, start, end)
+        await write_xlsx(records, path, filters.get("grouped") == "true")
+        return
+
+    if params["format"] in ("parquet", "arrow"):
+        records = iter_time_records(time_users(), 10.0, discount, start, end)
+        await write_time_columnar(records, path, params["format"])
+        return
+
+    users = await time_users().to_list(None)
+    await update_job(job["_id"], progress=0.1)
+    data = await calculate(
+        users, [], [], [], [], 10.0, discount, None, start=start, end=end
+    )
+    await update_job(job["_id"], progress=0.6)
+    await render(write_time_file, data, params["format"], path)
+
+
+async def export_members(job: dict, path: str):
+    """
+    Raw activity member rows, for analytics re-importing them in bulk
+    """
+    params = job["params"]
+    if params["format"] not in ("parquet", "arrow"):
+        raise ValueError("Members can only be exported as parquet or arrow")
+    await write_members_columnar(
+        path,
+        params["format"],
+        parse_iso_date(params.get("start")),
+        parse_iso_date(params.get("end")),
+    )
+
+
+async def export_namelist(job: dict, path: str):
+    """
+    Users by grade and class, for the namelist workbook
+    """
+    format = job["params"]["format"]
+    users = await load_namelist()
+    await update_job(job["_id"], progress=0.5)
+    if format == "xlsx":
+        await render(write_namelist, users, path)
+    elif format == "csv":
+        await render(write_namelist_csv, users, path)
+    else:
+        raise ValueError("Namelist can only be exported as xlsx or csv")
+
+
+async def export_collection(job: dict, path: str):
+    """
+    Documents of a collection in `exportable`, as NDJSON or CSV
+    """
+    export = Export(**job["params"])
+    cursor = collection_cursor(export)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        async for lines in stream_collection(cursor, export.collection, export.format):
+            file.write(lines)
+
+
+# Export handlers by `Export.collection`
+handlers: dict[str, Callable[[dict, str], Awaitable[None]]] = {
+    "time": export_time,
+    "members": export_members,
+    "namelist": export_namelist,
+    **{collection: export_collection for collection in exportable},
+}
+
+# Formats each handler can write
+formats: dict[str, set[str]] = {
+    "time": {"json", "csv", "xlsx", "parquet", "arrow"},
+    "members": {"parquet", "arrow"},
+    "namelist": {"xlsx", "csv"},
+    **{collection: {"ndjson", "csv"} for collection in exportable},
+}
+
+
+def export_response(job: dict) -> ExportResponse:
+    completed = job["status"] == ExportStatus.completed
+    return ExportResponse(
+        id=str(job["_id"]),
+        status=job["status"],
+        url=f"/api/export/{job['_id']}/download" if completed else None,
+        data=None,
+        format=job["params"]["format"],
+        error=job.get("error"),
+        progress=job.get("progress", 0.0),
+    )
+
+
+async def enqueue_export(export: Export, creator: str) -> str:
+    """
+    Store an export job and queue it for the workers,
+    completed at once if an identical export is stored already
+    """
+    if export.collection not in handlers:
+        raise HTTPException(status_code=400, detail="Unsupported export collection")
+    if export.format.value not in formats[export.collection]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{export.collection} can only be exported as "
+            + ", ".join(sorted(formats[export.collection])),
+        )
+    if export.collection in exportable:
+        # Reject invalid filters now rather than fail the job later
+        collection_cursor(export)
+    params = export.model_dump(mode="json")
+    stored = False
+    if export.collection in versioned_collections:
+        key = artifact_key(params, await data_version())
+        stored = await store.find(key) is not None
+    now = datetime.now().isoformat()
+    result = await db.zvms.exports.insert_one(
+        {
+            "params": params,
+            "status": ExportStatus.completed if stored else ExportStatus.pending,
+            "progress": 1.0 if stored else 0.0,
+            "error": None,
+            "file": key if stored else None,
+            "creator": creator,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+    )
+    if not stored:
+        await workers.queue.put(result.inserted_id)
+    return str(result.inserted_id)
+
+
+async def run_export(job_id: ObjectId):
+    # Claim the job, it may have been taken already
+    job = await db.zvms.exports.find_one_and_update(
+        {"_id": job_id, "status": ExportStatus.pending},
+        {"$set": {"status": ExportStatus.processing}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if job is None:
+        return
+    params = job["params"]
+    # Read before generating, data changed meanwhile is exported again next time
+    if params["collection"] in versioned_collections:
+        key = artifact_key(params, await data_version())
+    else:
+        key = artifact_key({**params, "job": str(job_id)}, await data_version())
+    if await store.find(key) is None:
+        path = store.staging_path(params["format"])
+        try:
+            await handlers[params["collection"]](job, path)
+            await store.put(key, path, params["format"])
+        except Exception as e:
+            logging.exception(f"Export {job_id} failed")
+            await store.discard(path)
+            await update_job(job_id, status=ExportStatus.failed, error=str(e))
+            return
+    await update_job(job_id, status=ExportStatus.completed, progress=1.0, file=key)
+
+
+async def _work():
+    while True:
+        job_id = await workers.queue.get()
+        try:
+            await run_export(job_id)
+        finally:
+            workers.queue.task_done()
+
+
+async def start_export_workers():
+    logging.info("Starting export workers...")
+    workers.queue = asyncio.Queue()
+    workers.executor = ProcessPoolExecutor(max_workers=concurrency)
+    # Jobs interrupted by a restart are exported again
+    await db.zvms.exports.update_many(
+        {"status": ExportStatus.processing}, {"$set": {"status": ExportStatus.pending}}
+    )
+    async for job in db.zvms.exports.find(
+        {"status": ExportStatus.pending}, {"_id": True}
+    ).sort("_id", 1):
+        await workers.queue.put(job["_id"])
+    workers.tasks = [asyncio.create_task(_work()) for _ in range(concurrency)]
+    logging.info("started export workers")
+
+
+async def stop_export_workers():
+    logging.info("stopping export workers...")
+    for task in workers.tasks:
+        task.cancel()
+    workers.executor.shutdown(wait=False, cancel_futures=True)
+    logging.info("stopped export workers")
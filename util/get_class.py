@@ -1,5 +1,6 @@
 from fastapi import HTTPException
 from database import db
+from util.group_directory import group_directory
 from utils import validate_object_id
 
 
@@ -8,29 +9,21 @@ async def get_user_class(user_oid: str) -> str:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user_group = user["group"]
-    class_id = None
-
-    grouping = await db.zvms.groups.find_one(
-        {
-            "_id": {"$in": [validate_object_id(group) for group in user_group]},
-            "type": "class",
-        }
-    )
+    grouping = group_directory.class_of(user["group"])
 
     if grouping is None:
         raise HTTPException(status_code=404, detail="User not in any class")
 
-    class_id = grouping["_id"]
-
-    if not class_id:
-        raise HTTPException(status_code=404, detail="User not in any class")
-
-    return class_id
+    return grouping["_id"]
 
 
 async def get_activities_related_to_user(
-    user_oid: str, page: int = -1, perpage: int = 10, query: str = "", target: str = ''
+    user_oid: str,
+    page: int = -1,
+    perpage: int = 10,
+    query: str = "",
+    target: str = '',
+    dates: dict = {},
 ):
 
     if not target:
@@ -42,6 +35,7 @@ async def get_activities_related_to_user(
         {
             "members._id": {"$in": [str(user["_id"]) for user in users]},
             "name": {"$regex": query, "$options": "i"},
+            **dates,
         }
     )
 
@@ -50,6 +44,7 @@ async def get_activities_related_to_user(
             "$match": {
                 "members._id": {"$in": [str(user["_id"]) for user in users]},
                 "name": {"$regex": query, "$options": "i"},
+                **dates,
             }
         },
         {
@@ -100,28 +95,22 @@ async def get_user_classname(user_id: str):
     if not user:
         return HTTPException(status_code=404, detail="User not found")
 
-    user_group = user["group"]
-    class_id = None
-
-    for group in user_group:
-        group = await db.zvms.groups.find_one({"_id": validate_object_id(group)})
-        if group["type"] == "class":
-            class_id = group["_id"]
-            break
+    grouping = group_directory.class_of(user["group"])
 
-    if not class_id:
+    if grouping is None:
         return HTTPException(status_code=404, detail="User not in any class")
 
-    class_name = await db.zvms.groups.find_one({"_id": class_id})
-    return class_name["name"]
+    return grouping["name"]
 
 
-async def get_classname(user: dict, groups: list[dict]):
-    if groups is None:
-        groups = await db.zvms.groups.find().to_list(None)
+async def get_classname(user: dict, groups: list[dict] = None):
     if user is None:
         return None
 
+    if groups is None:
+        grouping = group_directory.class_of(user["group"])
+        return grouping["name"] if grouping is not None else None
+
     for group in groups:
         if str(group["_id"]) in user["group"] and group["type"] == "class":
             return group["name"]
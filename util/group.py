@@ -1,21 +1,19 @@
 from bson import ObjectId
 from database import db
+from util.group_directory import group_directory
 
 
-async def get_user_permissions(user: dict):
+async def get_user_permissions(user: dict) -> list[str]:
     """
     Get user's permissions
     """
-    groups = user["group"]
-    permissions = []
+    permissions = set()
+    for group in user["group"]:
+        group = group_directory.get(group)
+        if group is not None:
+            permissions |= group["permissions"]
 
-    for group in groups:
-        group = await db.zvms.groups.find_one({"_id": ObjectId(group)})
-        for permission in group["permissions"]:
-            if permission not in permissions:
-                permissions.append(permission)
-
-    return permissions
+    return sorted(permissions)
 
 
 async def is_in_a_same_class(user: str, another_user: str):
@@ -23,24 +21,19 @@ async def is_in_a_same_class(user: str, another_user: str):
     Check if two users are in the same class
     """
     # Get user's groups and another_user's groups
-    user_group = await db.zvms.users.find_one({"_id": ObjectId(user)})
-    user_group = user_group["group"]
-    another_group = await db.zvms.users.find_one({"_id": ObjectId(another_user)})
-    another_group = another_group["group"]
-
-    user_group = [ObjectId(group) for group in user_group]
-    another_group = [ObjectId(group) for group in another_group]
-
-    user_group = await db.zvms.groups.find(
-        {"_id": {"$in": user_group}, "type": "class"}
-    ).to_list(1)
-
-    another_group = await db.zvms.groups.find(
-        {"_id": {"$in": another_group}, "type": "class"}
-    ).to_list(1)
-
-    if user_group and another_group:
-        if user_group[0]["_id"] == another_group[0]["_id"]:
+    groups = {
+        str(found["_id"]): found["group"]
+        async for found in db.zvms.users.find(
+            {"_id": {"$in": [ObjectId(user), ObjectId(another_user)]}},
+            {"group": True},
+        )
+    }
+
+    user_class = group_directory.class_of(groups.get(str(user), []))
+    another_class = group_directory.class_of(groups.get(str(another_user), []))
+
+    if user_class and another_class:
+        if user_class["_id"] == another_class["_id"]:
             return True
         else:
             return False
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from typing import Optional
+
+from database import db
+
+# Seconds between reloads, picking up writes made by other workers
+reload_interval = 60
+
+
+class GroupDirectory:
+    """
+    Every group in memory, by id and by type. Loaded at startup and
+    reloaded by group writes, lookups never wait for the database.
+    """
+
+    def __init__(self):
+        self.groups: dict[str, dict] = {}
+        self.types: dict[str, list[dict]] = {}
+        self.task: asyncio.Task = None  # type: ignore
+
+    async def load(self):
+        groups = await db.zvms.groups.find().to_list(None)
+        types: dict[str, list[dict]] = {}
+        for group in groups:
+            group["permissions"] = frozenset(group.get("permissions") or [])
+            types.setdefault(group["type"], []).append(group)
+        # Swap in whole, lookups never see a half-loaded directory
+        self.groups = {str(group["_id"]): group for group in groups}
+        self.types = types
+
+    def get(self, group_id) -> Optional[dict]:
+        return self.groups.get(str(group_id))
+
+    def of_type(self, type: str) -> list[dict]:
+        return self.types.get(type, [])
+
+    def class_of(self, user_groups: list) -> Optional[dict]:
+        """
+        First class among a user's groups
+        """
+        for group_id in user_groups:
+            group = self.get(group_id)
+            if group is not None and group["type"] == "class":
+                return group
+        return None
+
+    def class_name(self, group_id) -> Optional[str]:
+        group = self.get(group_id)
+        if group is None or group["type"] != "class":
+            return None
+        return group["name"]
+
+    async def _reload_forever(self):
+        while True:
+            await asyncio.sleep(reload_interval)
+            try:
+                await self.load()
+            except Exception:
+                logging.exception("Group directory reload failed")
+
+
+group_directory = GroupDirectory()
+
+
+async def refresh_group_directory():
+    await group_directory.load()
+
+
+async def start_group_directory():
+    logging.info("Loading group directory...")
+    await group_directory.load()
+    group_directory.task = asyncio.create_task(group_directory._reload_forever())
+    logging.info("loaded group directory")
+
+
+async def stop_group_directory():
+    if group_directory.task is not None:
+        group_directory.task.cancel()
@@ -0,0 +1,82 @@
+from typing import Iterator
+
+import pandas as pd
+from fastapi import HTTPException
+
+from database import db
+from typings.activity import ActivityMode, MemberActivityStatus
+from util.spreadsheet import row_errors
+from util.user_time import refresh_user_time
+
+# Member sheet columns, `id` is the student id
+member_columns = ["id", "duration", "mode"]
+
+
+async def import_members(activity: dict, chunks: Iterator[pd.DataFrame]) -> dict:
+    """
+    Append members of a sheet to an activity in a single update,
+    returns the count and a report of rejected rows
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return {"inserted": 0, "errors": []}
+    sheet = pd.concat(chunks)
+
+    # Student ids to oids in one query
+    oids = {
+        user["id"]: str(user["_id"])
+        async for user in db.zvms.users.find(
+            {"id": {"$in": list(sheet["id"].unique())}}, {"id": True}
+        )
+    }
+    members = sheet["id"].map(oids)
+    duration = pd.to_numeric(sheet["duration"], errors="coerce")
+    joined = {member["_id"] for member in activity["members"]}
+
+    messages = row_errors(
+        {
+            "Missing id": sheet["id"] == "",
+            "Unknown user": (sheet["id"] != "") & members.isna(),
+            "Invalid duration": ~(duration > 0),
+            "Invalid mode": ~sheet["mode"].isin([mode.value for mode in ActivityMode]),
+            # The first row of a student is imported, later ones are reported
+            "Duplicate user in sheet": members.notna()
+            & members.duplicated(keep="first"),
+            "Already a member": members.isin(joined),
+        },
+        sheet.index,
+    )
+
+    valid = messages.str.len() == 0
+    added = [
+        {
+            "_id": member,
+            "status": MemberActivityStatus.effective.value,
+            "mode": mode,
+            "duration": float(hours),
+        }
+        for member, mode, hours in zip(
+            members[valid], sheet["mode"][valid], duration[valid]
+        )
+    ]
+    if added:
+        ids = [member["_id"] for member in added]
+        # No member may have been added since the activity was read
+        result = await db.zvms.activities.update_one(
+            {"_id": activity["_id"], "members._id": {"$nin": ids}},
+            {"$push": {"members": {"$each": added}}},
+        )
+        if result.modified_count == 0:
+            raise HTTPException(
+                status_code=409, detail="Members changed during the import"
+            )
+        await refresh_user_time(ids)
+
+    return {
+        "inserted": len(added),
+        "errors": [
+            {"row": row, "id": sheet["id"][row], "errors": messages[row]}
+            for row in sheet.index
+            if messages[row]
+        ],
+    }
@@ -0,0 +1,97 @@
+import csv
+from itertools import groupby
+
+from openpyxl import Workbook
+
+from database import db
+from util.time_export import grade_of
+
+columns = [
+    "_id",
+    "ID",
+    "Name",
+    "Class ID",
+    "On Campus",
+    "Off Campus",
+    "Social Practice",
+]
+
+# Users with the name of their first class group, resolved on the server
+namelist_pipeline = [
+    {"$project": {"id": True, "name": True, "group": {"$ifNull": ["$group", []]}}},
+    {
+        "$lookup": {
+            "from": "groups",
+            "let": {
+                "groups": {
+                    "$map": {"input": "$group", "in": {"$toString": "$$this"}}
+                }
+            },
+            "pipeline": [
+                {
+                    "$match": {
+                        "type": "class",
+                        "$expr": {"$in": [{"$toString": "$_id"}, "$$groups"]},
+                    }
+                },
+                {"$project": {"_id": False, "name": True}},
+                {"$limit": 1},
+            ],
+            "as": "class",
+        }
+    },
+    {
+        "$project": {
+            "_id": {"$toString": "$_id"},
+            "id": True,
+            "name": True,
+            "class": {"$first": "$class.name"},
+        }
+    },
+]
+
+
+async def load_namelist() -> list[dict]:
+    """
+    Every user with their class name, in one aggregation
+    """
+    return await db.zvms.users.aggregate(namelist_pipeline).to_list(None)
+
+
+def namelist_row(user: dict) -> list:
+    return [user["_id"], user["id"], user["name"], user.get("class"), 0, 0, 0]
+
+
+def grade_sheet(users: list[dict]) -> list[list]:
+    """
+    Rows of one grade sheet sorted by class and ID
+    """
+    users = sorted(users, key=lambda user: (user.get("class") or "", user["id"]))
+    return [namelist_row(user) for user in users]
+
+
+def write_namelist(users: list[dict], path: str):
+    """
+    Write one sheet per grade. An xlsx file is written by a single process,
+    so the whole workbook is built in one export worker, off the event loop.
+    """
+
+    def grade(user: dict) -> str:
+        return grade_of(user.get("class"))
+
+    workbook = Workbook(write_only=True)
+    for name, members in groupby(sorted(users, key=grade), key=grade):
+        sheet = workbook.create_sheet(title=name)
+        sheet.append(columns)
+        for row in grade_sheet(list(members)):
+            sheet.append(row)
+    if not workbook.worksheets:
+        workbook.create_sheet(title="Other").append(columns)
+    workbook.save(path)
+
+
+def write_namelist_csv(users: list[dict], path: str):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        writer.writerows(grade_sheet(users))
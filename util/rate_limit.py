@@ -0,0 +1,101 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Hashable, Optional
+
+from fastapi import HTTPException
+
+
+class TokenBucket:
+    """
+    Token buckets by key, refilled at `rate` per second up to `burst`.
+    The least recently used buckets are dropped beyond `max_keys`.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 65536):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+
+    def acquire(self, key: Hashable) -> Optional[float]:
+        """
+        Take a token, returns None if allowed or seconds until one is available
+        """
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return None if allowed else (1 - tokens) / self.rate
+
+
+class LoginAdmission:
+    """
+    Admission control of credential checks: per account and per client
+    buckets, and a cap on checks in flight
+    """
+
+    def __init__(self, max_in_flight: int):
+        # A few retries per account, a whole class logging in behind one address
+        self.accounts = TokenBucket(rate=1 / 12, burst=5)
+        self.clients = TokenBucket(rate=2, burst=100)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.admitted = 0
+        self.limited_accounts = 0
+        self.limited_clients = 0
+        self.overloaded = 0
+
+    def _reject(self, retry_after: float):
+        raise HTTPException(
+            status_code=429,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    @asynccontextmanager
+    async def admit(self, client: Optional[str]):
+        """
+        Take a slot of the in-flight cap and a token of the client's bucket,
+        before anything reads the database
+        """
+        if self.in_flight >= self.max_in_flight:
+            self.overloaded += 1
+            self._reject(1)
+        retry_after = self.clients.acquire(client)
+        if retry_after is not None:
+            self.limited_clients += 1
+            self._reject(retry_after)
+
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def charge(self, account: str):
+        """
+        Take a token of the account's bucket, once the login id is resolved
+        """
+        retry_after = self.accounts.acquire(account)
+        if retry_after is not None:
+            self.limited_accounts += 1
+            self._reject(retry_after)
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": self.in_flight,
+            "admitted": self.admitted,
+            "limitedAccounts": self.limited_accounts,
+            "limitedClients": self.limited_clients,
+            "overloaded": self.overloaded,
+        }
+
+
+login_admission = LoginAdmission(max_in_flight=4 * (os.cpu_count() or 1))
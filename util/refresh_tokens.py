@@ -0,0 +1,97 @@
+import datetime
+from typing import Optional
+
+import jwt
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from database import db
+from util.cert import jwt_decode, jwt_private_key
+
+# Lifetime of a refresh token, each use replaces it with a new one
+refresh_duration = datetime.timedelta(days=30)
+
+
+async def issue_refresh_token(user_oid: str, family: Optional[str] = None) -> str:
+    """
+    Issue a refresh token tracked by its jti in `refresh_tokens`.
+    Tokens rotated from the same login share a family.
+    """
+    jti = str(ObjectId())
+    now = datetime.datetime.utcnow()
+    expires = now + refresh_duration
+    await db.zvms.refresh_tokens.insert_one(
+        {
+            "_id": jti,
+            "user": user_oid,
+            "family": family or jti,
+            "expiresAt": expires,
+            "usedAt": None,
+        }
+    )
+    payload = {
+        "iss": "zvms",
+        "exp": expires,
+        "iat": now,
+        "sub": user_oid,
+        "scope": "refresh_token",
+        "jti": jti,
+        "family": family or jti,
+    }
+    return jwt.encode(payload, jwt_private_key, algorithm="HS256")
+
+
+async def rotate_refresh_token(token: str) -> tuple[str, str]:
+    """
+    Spend a refresh token, returns its user and the token replacing it.
+    A token spent twice was stolen or leaked, so its whole family is revoked.
+    """
+    credentials_exception = HTTPException(
+        status_code=401, detail="Invalid refresh token"
+    )
+    try:
+        payload = jwt_decode(token)
+    except jwt.PyJWTError:
+        raise credentials_exception
+    if payload.get("scope") != "refresh_token":
+        raise credentials_exception
+
+    entry = await db.zvms.refresh_tokens.find_one_and_update(
+        {
+            "_id": payload["jti"],
+            "usedAt": None,
+            "expiresAt": {"$gt": datetime.datetime.utcnow()},
+        },
+        {"$set": {"usedAt": datetime.datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if entry is None:
+        await revoke_refresh_family(payload["family"])
+        raise credentials_exception
+
+    return entry["user"], await issue_refresh_token(entry["user"], entry["family"])
+
+
+async def revoke_refresh_family(family: str):
+    await db.zvms.refresh_tokens.delete_many({"family": family})
+
+
+async def revoke_user_refresh_tokens(user_oid: str):
+    """
+    Revoke every refresh token of a user, as when the password changes
+    """
+    await db.zvms.refresh_tokens.delete_many({"user": user_oid})
+
+
+async def revoke_refresh_token(token: str):
+    """
+    Revoke the family of a refresh token, as on logout
+    """
+    try:
+        payload = jwt_decode(token)
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    if payload.get("scope") != "refresh_token":
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    await revoke_refresh_family(payload["family"])
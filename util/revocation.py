@@ -0,0 +1,161 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+import math
+import time
+
+from database import db
+
+# Seconds between syncs of revocations from other workers
+sync_interval = 10
+# Syncs between full reloads, which drop expired revocations
+reload_every = 60
+
+
+class BloomFilter:
+    """
+    Bit array answering "maybe present" or "surely absent"
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.capacity = capacity
+
+    def _positions(self, key: str):
+        digest = hashlib.sha256(key.encode("utf-8")).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:16], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position // 8] & (1 << (position % 8))
+            for position in self._positions(key)
+        )
+
+
+class RevocationList:
+    """
+    Revoked jtis mirrored from `revoked_tokens`. Most tokens are absent from
+    the Bloom filter, positives are confirmed by the exact set.
+    """
+
+    def __init__(self, capacity: int = 65536):
+        self.capacity = capacity
+        self.filter = BloomFilter(capacity)
+        self.revoked: set[str] = set()
+        self.synced_at = 0.0
+        self.cursor = datetime.datetime.min
+        self.syncs = 0
+        self.checks = 0
+        self.positives = 0
+        self.false_positives = 0
+        self.task: asyncio.Task = None  # type: ignore
+
+    def add(self, jti: str):
+        if len(self.revoked) >= self.filter.capacity:
+            # Rebuild a bigger filter before its error rate grows
+            self.filter = BloomFilter(self.filter.capacity * 2)
+            for revoked in self.revoked:
+                self.filter.add(revoked)
+        self.filter.add(jti)
+        self.revoked.add(jti)
+
+    def is_revoked(self, jti: str) -> bool:
+        self.checks += 1
+        if jti not in self.filter:
+            return False
+        self.positives += 1
+        if jti in self.revoked:
+            return True
+        self.false_positives += 1
+        return False
+
+    async def sync(self):
+        """
+        Read revocations since the last sync, or all of them on a reload
+        """
+        started = datetime.datetime.utcnow()
+        reload = self.syncs % reload_every == 0
+        query = {"expiresAt": {"$gt": started}}
+        if not reload:
+            query["revokedAt"] = {"$gte": self.cursor}
+        jtis = [
+            entry["_id"]
+            async for entry in db.zvms.revoked_tokens.find(query, {"_id": True})
+        ]
+        if reload:
+            filter = BloomFilter(max(self.capacity, len(jtis) * 2))
+            for jti in jtis:
+                filter.add(jti)
+            # Swap in whole, checks never see a half-built filter
+            self.filter, self.revoked = filter, set(jtis)
+        else:
+            for jti in jtis:
+                self.add(jti)
+        # Revocations written while reading are read again next time
+        self.cursor = started - datetime.timedelta(seconds=sync_interval)
+        self.syncs += 1
+        self.synced_at = time.time()
+
+    async def _sync_forever(self):
+        while True:
+            await asyncio.sleep(sync_interval)
+            try:
+                await self.sync()
+            except Exception:
+                logging.exception("Revocation sync failed")
+
+    def stats(self) -> dict:
+        return {
+            "revoked": len(self.revoked),
+            "staleness": time.time() - self.synced_at if self.synced_at else None,
+            "checks": self.checks,
+            "positives": self.positives,
+            "falsePositives": self.false_positives,
+        }
+
+
+revocations = RevocationList()
+
+
+async def revoke_token(jti: str, user: str, exp: float):
+    """
+    Revoke a token until it expires, at once in this worker
+    and in others after their next sync
+    """
+    expires = datetime.datetime.utcfromtimestamp(exp)
+    await db.zvms.revoked_tokens.update_one(
+        {"_id": jti},
+        {
+            "$setOnInsert": {
+                "user": user,
+                "expiresAt": expires,
+                "revokedAt": datetime.datetime.utcnow(),
+            }
+        },
+        upsert=True,
+    )
+    revocations.add(jti)
+
+
+async def start_revocation_sync():
+    logging.info("Starting revocation sync...")
+    await revocations.sync()
+    revocations.task = asyncio.create_task(revocations._sync_forever())
+    logging.info("started revocation sync")
+
+
+async def stop_revocation_sync():
+    logging.info("stopping revocation sync...")
+    if revocations.task is not None:
+        revocations.task.cancel()
+    logging.info("stopped revocation sync")
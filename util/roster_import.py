@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
+import bcrypt
+import pandas as pd
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from database import db
+from typings.user import UserSex
+from util.artifact_store import bump_data_version
+from util.group_directory import group_directory
+from util.spreadsheet import row_errors
+
+# Roster columns, `sex` defaults to unknown
+required_columns = ["id", "name", "class", "password"]
+optional_columns = {"sex": UserSex.unknown.value}
+
+
+class ImportWorkers:
+    executor: ProcessPoolExecutor = None  # type: ignore
+
+
+workers = ImportWorkers()
+
+
+def validate_chunk(
+    chunk: pd.DataFrame, classes: dict[str, str], seen: set[str]
+) -> pd.Series:
+    """
+    Error messages of each row, checked column-wise over the chunk
+    """
+    ids = chunk["id"]
+    checks = {
+        "Missing id": ids == "",
+        "Invalid id": (ids != "") & ~ids.str.fullmatch(r"\d+"),
+        "Missing name": chunk["name"] == "",
+        "Unknown class": ~chunk["class"].isin(classes.keys()),
+        "Missing password": chunk["password"] == "",
+        "Invalid sex": ~chunk["sex"].isin([sex.value for sex in UserSex]),
+        # The first row of an id is imported, later ones are reported
+        "Duplicate id in roster": (ids != "")
+        & (ids.duplicated(keep="first") | ids.isin(seen)),
+    }
+    return row_errors(checks, chunk.index)
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    return [
+        bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+        for password in passwords
+    ]
+
+
+async def hash_in_pool(passwords: list[str]) -> list[str]:
+    """
+    Hash passwords in slices across the pool processes
+    """
+    loop = asyncio.get_running_loop()
+    processes = os.cpu_count() or 1
+    size = max(1, -(-len(passwords) // processes))
+    slices = await asyncio.gather(
+        *[
+            loop.run_in_executor(
+                workers.executor, hash_passwords, passwords[i : i + size]
+            )
+            for i in range(0, len(passwords), size)
+        ]
+    )
+    return [hashed for part in slices for hashed in part]
+
+
+async def import_roster(chunks: Iterator[pd.DataFrame]) -> dict:
+    """
+    Insert users of a roster, returns the count and a report of rejected rows
+    """
+    classes = {
+        group["name"]: str(group["_id"]) for group in group_directory.of_type("class")
+    }
+    seen: set[str] = set()
+    errors = []
+    inserted = 0
+
+    for chunk in chunks:
+        messages = validate_chunk(chunk, classes, seen)
+        seen.update(chunk["id"])
+
+        valid = chunk[messages.str.len() == 0]
+        existing = {
+            user["id"]
+            async for user in db.zvms.users.find(
+                {"id": {"$in": list(valid["id"])}}, {"id": True}
+            )
+        }
+        for row in valid.index[valid["id"].isin(existing)]:
+            messages[row].append("User already exists")
+        valid = valid[~valid["id"].isin(existing)]
+
+        passwords = await hash_in_pool(list(valid["password"]))
+        operations = [
+            InsertOne(
+                {
+                    "id": id,
+                    "name": name,
+                    "sex": sex,
+                    "group": [classes[classname]],
+                    "password": password,
+                }
+            )
+            for id, name, sex, classname, password in zip(
+                valid["id"], valid["name"], valid["sex"], valid["class"], passwords
+            )
+        ]
+        if operations:
+            try:
+                result = await db.zvms.users.bulk_write(operations, ordered=False)
+                inserted += result.inserted_count
+            except BulkWriteError as e:
+                inserted += e.details["nInserted"]
+                for error in e.details["writeErrors"]:
+                    row = valid.index[error["index"]]
+                    messages[row].append(
+                        "User already exists"
+                        if error["code"] == 11000
+                        else error["errmsg"]
+                    )
+
+        errors += [
+            {"row": row, "id": chunk["id"][row], "errors": messages[row]}
+            for row in chunk.index
+            if messages[row]
+        ]
+
+    if inserted:
+        await bump_data_version()
+    return {"inserted": inserted, "errors": errors}
+
+
+async def start_import_workers():
+    logging.info("Starting import workers...")
+    workers.executor = ProcessPoolExecutor()
+    logging.info("started import workers")
+
+
+async def stop_import_workers():
+    logging.info("stopping import workers...")
+    if workers.executor is not None:
+        workers.executor.shutdown(wait=False, cancel_futures=True)
+    logging.info("stopped import workers")
@@ -0,0 +1,96 @@
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException, UploadFile
+from openpyxl import load_workbook
+
+# Rows read at a time
+chunk_size = 500
+
+
+def _normalize(
+    frame: pd.DataFrame, columns: list[str], defaults: dict[str, str]
+) -> pd.DataFrame:
+    frame.columns = [str(column).strip().lower() for column in frame.columns]
+    missing = [column for column in columns if column not in frame.columns]
+    if missing:
+        raise HTTPException(
+            status_code=400, detail=f"Missing columns: {', '.join(missing)}"
+        )
+    for column in defaults:
+        if column not in frame.columns:
+            frame[column] = ""
+    frame = frame[[*columns, *defaults]].fillna("").astype(str)
+    frame = frame.apply(lambda column: column.str.strip())
+    for column, default in defaults.items():
+        frame[column] = frame[column].replace("", default)
+    return frame
+
+
+def read_csv_chunks(
+    file, columns: list[str], defaults: dict[str, str] = {}
+) -> Iterator[pd.DataFrame]:
+    for chunk in pd.read_csv(
+        file, dtype=str, keep_default_na=False, chunksize=chunk_size
+    ):
+        yield _normalize(chunk, columns, defaults)
+
+
+def read_xlsx_chunks(
+    file, columns: list[str], defaults: dict[str, str] = {}
+) -> Iterator[pd.DataFrame]:
+    workbook = load_workbook(file, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell or "") for cell in next(rows, ())]
+        chunk = []
+        for row in rows:
+            row = ["" if cell is None else str(cell) for cell in row[: len(header)]]
+            chunk.append(row + [""] * (len(header) - len(row)))
+            if len(chunk) >= chunk_size:
+                yield _normalize(pd.DataFrame(chunk, columns=header), columns, defaults)
+                chunk = []
+        if chunk:
+            yield _normalize(pd.DataFrame(chunk, columns=header), columns, defaults)
+    finally:
+        workbook.close()
+
+
+def read_upload_chunks(
+    file: UploadFile, columns: list[str], defaults: dict[str, str] = {}
+) -> Iterator[pd.DataFrame]:
+    """
+    Chunks of an uploaded CSV or XLSX sheet with `columns` and `defaults`,
+    indexed by line in the file
+    """
+    filename = (file.filename or "").lower()
+    if filename.endswith(".csv"):
+        chunks = read_csv_chunks(file.file, columns, defaults)
+    elif filename.endswith(".xlsx"):
+        chunks = read_xlsx_chunks(file.file, columns, defaults)
+    else:
+        raise HTTPException(status_code=400, detail="File must be CSV or XLSX")
+    return _numbered(chunks)
+
+
+def _numbered(chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    # Rows are numbered as in the file, after the header
+    line = 2
+    for chunk in chunks:
+        chunk.index = range(line, line + len(chunk))
+        line += len(chunk)
+        yield chunk
+
+
+def row_errors(checks: dict[str, pd.Series], index: pd.Index) -> pd.Series:
+    """
+    Messages of the checks each row failed, from boolean masks by message
+    """
+    masks = np.column_stack([mask.to_numpy() for mask in checks.values()])
+    messages = np.array(list(checks.keys()))
+    return pd.Series(
+        [[str(message) for message in messages[row]] for row in masks],
+        index=index,
+        dtype=object,
+    )
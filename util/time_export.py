@@ -1,55 +1,137 @@
-from io import BytesIO
-from fastapi import Response
+import csv
+from datetime import datetime
+from io import StringIO
+import json
+from typing import AsyncIterator, Optional
 from fastapi.responses import StreamingResponse
-import pandas as pd
-import tempfile
-from tqdm import tqdm
+from openpyxl import Workbook
+import asyncio
 
-from util.calculate import calculate_time
+from util.vector_calculate import calculate_time_vector
 from util.get_class import get_classname, get_user_classname
 
 
-def json2dataframe(data: list[dict]):
-    result = {}
-    for item in data:
-        result[item["id"]] = [
-            item["info"]["name"],
-            item["info"]["id"],
-            item["info"]["group"],
-            item["time"]["on-campus"],
-            item["time"]["off-campus"],
-            item["time"]["social-practice"],
-            item["time"]["trophy"],
-            item["time"]["total"],
-        ]
-    df = pd.DataFrame(result)
-    return df
-
-
-def json2csv(data: list[dict]):
-    df = json2dataframe(data)
-    buffer = df.to_csv(index=False)
-    return Response(
-        content=buffer,
+columns = [
+    "Name",
+    "ID",
+    "Class",
+    "On Campus",
+    "Off Campus",
+    "Social Practice",
+    "Trophy",
+    "Total",
+]
+
+media_types = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+def time_row(item: dict) -> list:
+    return [
+        item["info"]["name"],
+        item["info"]["id"],
+        item["info"]["group"],
+        item["time"]["on-campus"],
+        item["time"]["off-campus"],
+        item["time"]["social-practice"],
+        item["time"]["trophy"],
+        item["time"]["total"],
+    ]
+
+
+def csv_line(row: list) -> str:
+    buffer = StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
+
+
+async def stream_csv(records: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """
+    Render time records to CSV lines as they arrive
+    """
+    yield csv_line(columns)
+    async for record in records:
+        yield csv_line(time_row(record))
+
+
+def json2csv_stream(lines: AsyncIterator[str]):
+    return StreamingResponse(
+        content=lines,
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=time.csv"},
     )
 
 
-def json2xlsx(data: list[dict]):
-    df = json2dataframe(data)
-    with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as temp_file:
-        with pd.ExcelWriter(temp_file.name, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False)
-    with open(temp_file.name, "rb") as file:
-        buffer = file.read()
-    content_stream = BytesIO(buffer)
-    return StreamingResponse(
-        content=content_stream,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=time.xlsx"},
-    )
-    # Use the buffer as needed
+def grade_of(classname: Optional[str]) -> str:
+    # The second character of a class name is its grade, as in export.py
+    if not classname or len(classname) < 2:
+        return "Other"
+    return classname[1]
+
+
+class TimeWorkbook:
+    """
+    Write-only workbook, rows go to disk as they are appended
+    so memory doesn't grow with the number of users
+    """
+
+    def __init__(self, grouped: bool = False):
+        self.workbook = Workbook(write_only=True)
+        self.grouped = grouped
+        self.sheets = {}
+
+    def sheet(self, name: str):
+        if name not in self.sheets:
+            self.sheets[name] = self.workbook.create_sheet(title=name)
+            self.sheets[name].append(columns)
+        return self.sheets[name]
+
+    def append(self, record: dict):
+        name = grade_of(record["info"]["group"]) if self.grouped else "Time"
+        self.sheet(name).append(time_row(record))
+
+    def extend(self, records: list[dict]):
+        for record in records:
+            self.append(record)
+
+    def save(self, file):
+        if not self.sheets:
+            self.sheet("Time")
+        self.workbook.save(file)
+
+
+async def write_xlsx(
+    records: AsyncIterator[dict], file, grouped: bool = False, chunk_size: int = 1000
+):
+    """
+    Append time records to a write-only workbook as they arrive, then save it.
+    Rows are appended a chunk at a time in a thread, off the event loop.
+    """
+    workbook = TimeWorkbook(grouped)
+    chunk = []
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            await asyncio.to_thread(workbook.extend, chunk)
+            chunk = []
+    await asyncio.to_thread(workbook.extend, chunk)
+    await asyncio.to_thread(workbook.save, file)
+
+
+def write_time_file(data: list[dict], format: str, path: str):
+    """
+    Write calculated time to `path` as JSON, runs in the export worker processes
+    """
+    if format != "json":
+        raise ValueError(f"Unsupported format: {format}")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
 
 
 async def calculate(
@@ -61,26 +143,55 @@ async def calculate(
     prize_full: float,
     discount: bool,
     groups: list[dict],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
 ):
+    times = await calculate_time_vector(
+        [str(user["_id"]) for user in users],
+        prize_full,
+        discount,
+        start=start,
+        end=end,
+    )
     result = []
-    for user in tqdm(users):
-        time = await calculate_time(
-            str(user["_id"]),
-            normal_activities,
-            special_activities,
-            prize_activities,
-            trophies,
-            prize_full,
-            discount,
-        )
+    for user in users:
         classname = await get_classname(user, groups)
         if classname is None:
             continue
         result.append(
             {
                 "id": str(user["_id"]),
-                "time": time,
+                "time": times[str(user["_id"])],
                 "info": {"name": user["name"], "id": user["id"], "group": classname},
             }
         )
     return result
+
+
+async def iter_time_records(
+    users: AsyncIterator[dict],
+    prize_full: float = 10.0,
+    discount: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_size: int = 200,
+) -> AsyncIterator[dict]:
+    """
+    Yield time records while users are read from a cursor, calculating
+    `chunk_size` users at a time so memory doesn't grow with the school
+    """
+    chunk = []
+    async for user in users:
+        chunk.append(user)
+        if len(chunk) < chunk_size:
+            continue
+        for record in await calculate(
+            chunk, [], [], [], [], prize_full, discount, None, start, end
+        ):
+            yield record
+        chunk = []
+    if chunk:
+        for record in await calculate(
+            chunk, [], [], [], [], prize_full, discount, None, start, end
+        ):
+            yield record
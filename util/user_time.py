@@ -0,0 +1,147 @@
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import db
+from util.artifact_store import bump_data_version
+from util.batch_calculate import calculate_time_batch
+from util.cache import LRUCache
+from util.calculate import calculate_time_combined
+
+# Fields kept in the `user_time` ledger, same keys as `calculate_time` returns
+fields = ["on-campus", "off-campus", "social-practice", "trophy", "total"]
+
+# Results of `get_user_time` by user oid, invalidated by `refresh_user_time`.
+# Writes of other processes (other workers, `ledger.py`) are only seen on expiry.
+time_cache = LRUCache(max_entries=8192, max_bytes=16 * 1024 * 1024)
+# Seconds a cached result is served for
+time_cache_ttl = 30
+
+
+def _entry(time: dict[str, float], computed_at: datetime) -> dict:
+    result = {field: time[field] for field in fields}
+    result["updatedAt"] = datetime.now().isoformat()
+    result["computedAt"] = computed_at
+    return result
+
+
+async def _write_entries(times: dict[str, dict[str, float]], computed_at: datetime):
+    """
+    Write ledger entries computed from data read after `computed_at`,
+    skipping users whose entry was already computed later
+    """
+    if not times:
+        return
+    try:
+        await db.zvms.user_time.bulk_write(
+            [
+                UpdateOne(
+                    {
+                        "_id": user,
+                        "$or": [
+                            {"computedAt": {"$lt": computed_at}},
+                            {"computedAt": {"$exists": False}},
+                        ],
+                    },
+                    {"$set": _entry(time, computed_at)},
+                    upsert=True,
+                )
+                for user, time in times.items()
+            ],
+            ordered=False,
+        )
+    except BulkWriteError as e:
+        # A newer entry fails the filter and the upsert then hits its _id
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+
+async def refresh_user_time(users: list[str]):
+    """
+    Recalculate ledger entries of users whose activity or trophy members changed
+    """
+    users = list({str(user) for user in users if user is not None})
+    if not users:
+        return
+    # Taken before reading, a later stamp has seen at least the same writes
+    computed_at = datetime.now()
+    times = await calculate_time_batch(users)
+    await _write_entries(times, computed_at)
+    # Invalidate after the ledger is written, so no reader can cache the old entry
+    for user in users:
+        time_cache.invalidate(user)
+    await bump_data_version()
+
+
+async def get_user_time(user: str) -> dict[str, float]:
+    """
+    Read user's time from the ledger, calculate and store it on first access
+    """
+    cached = time_cache.get(user)
+    if cached is not None:
+        return dict(cached)
+    version = time_cache.version(user)
+    entry = await db.zvms.user_time.find_one({"_id": user})
+    if entry is not None:
+        result = {field: entry[field] for field in fields}
+    else:
+        computed_at = datetime.now()
+        result = await calculate_time_combined(user)
+        # Never overwrite an entry written by a concurrent `refresh_user_time`
+        await db.zvms.user_time.update_one(
+            {"_id": user}, {"$setOnInsert": _entry(result, computed_at)}, upsert=True
+        )
+    time_cache.put(user, dict(result), version, time.time() + time_cache_ttl)
+    return result
+
+
+async def rebuild_user_time(fix: bool = True) -> list[dict]:
+    """
+    Recalculate every user's time from activities and trophies,
+    returns entries which drift from the ledger and rewrites them if `fix`.
+    Entries of users who no longer exist are reported with `actual` None.
+    """
+    users = [str(user["_id"]) async for user in db.zvms.users.find({}, {"_id": 1})]
+    computed_at = datetime.now()
+    times = await calculate_time_batch(users)
+
+    drifts = []
+    async for entry in db.zvms.user_time.find({}):
+        ledger = {field: entry.get(field) for field in fields}
+        if entry["_id"] not in times:
+            drifts.append({"user": entry["_id"], "ledger": ledger, "actual": None})
+            continue
+        time = times[entry["_id"]]
+        if ledger != time:
+            drifts.append({"user": entry["_id"], "ledger": ledger, "actual": time})
+        del times[entry["_id"]]
+    # Users without ledger entries are reported as missing
+    for user, time in times.items():
+        drifts.append({"user": user, "ledger": None, "actual": time})
+
+    if fix and drifts:
+        await _write_entries(
+            {
+                drift["user"]: drift["actual"]
+                for drift in drifts
+                if drift["actual"] is not None
+            },
+            computed_at,
+        )
+        orphans = [drift["user"] for drift in drifts if drift["actual"] is None]
+        if orphans:
+            # Not entries of users created and calculated since they were listed
+            await db.zvms.user_time.delete_many(
+                {
+                    "_id": {"$in": orphans},
+                    "$or": [
+                        {"computedAt": {"$lt": computed_at}},
+                        {"computedAt": {"$exists": False}},
+                    ],
+                }
+            )
+        # Running servers serve repaired entries once their cache expires
+        await bump_data_version()
+    return drifts
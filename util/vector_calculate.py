@@ -0,0 +1,237 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from util.batch_calculate import (
+    calculate_time_batch,
+    category_pipelines,
+    stream_first_members,
+)
+
+columns = ["on-campus", "off-campus", "social-practice", "trophy", "total"]
+
+
+def _trophy_duration(document: dict, member: dict) -> Optional[float]:
+    # Only the first award named after the trophy counts, as in `summarize_awards`
+    for award in document.get("awards", []):
+        if award["name"] == document.get("award"):
+            if member["mode"] not in ("on-campus", "off-campus"):
+                return None
+            return award["duration"]
+    return None
+
+
+async def _load_rows(kind: str, collection, pipeline: list[dict]) -> list[tuple]:
+    rows = []
+    async for document, member in stream_first_members(collection, pipeline):
+        duration = member.get("duration")
+        if kind == "trophy":
+            duration = _trophy_duration(document, member)
+            if duration is None:
+                continue
+        rows.append((member["_id"], kind, member["mode"], duration))
+    return rows
+
+
+async def load_member_rows(
+    users: Optional[list[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> pd.DataFrame:
+    """
+    Load flattened (user, kind, mode, duration) rows of every time category.
+    Rows keep the document order, which decides trophy truncation.
+    """
+    loaded = await asyncio.gather(
+        *[
+            _load_rows(kind, collection, pipeline)
+            for kind, (collection, pipeline) in category_pipelines(users, start, end).items()
+        ]
+    )
+    return pd.DataFrame(
+        [row for rows in loaded for row in rows],
+        columns=["user", "kind", "mode", "duration"],
+    )
+
+
+def _grid(codes: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """
+    Lay each user's values out on one row of a (users, rows) grid, in row order
+    """
+    position = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    width = int(position.max()) + 1 if len(position) else 0
+    grid = np.zeros((size, width), dtype=values.dtype)
+    grid[codes, position] = values
+    return grid
+
+
+def _running_sums(grid: np.ndarray, initial: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Left-to-right running sums of each grid row, starting from `initial`.
+    `np.cumsum` adds in the same order as the scalar loops, while pandas
+    group sums are compensated and may settle ties at the limit differently.
+    """
+    first = np.zeros(len(grid)) if initial is None else initial
+    return np.cumsum(np.column_stack([first, grid]), axis=1)
+
+
+def _round(values: np.ndarray) -> np.ndarray:
+    """
+    Round to 0.1 like Python `round` in the scalar rules, which rounds the exact
+    value half to even. `np.round` and `np.floor(x * 10 + 0.5)` round `x * 10`
+    after it is rounded itself, and settle values such as 2.55 (2.5499...) upward.
+    """
+    # x * 10 is exactly `scaled + error`, as 8x and 2x are exact
+    eight, two = values * 8, values * 2
+    scaled = eight + two
+    carried = scaled - eight
+    error = (eight - (scaled - carried)) + (two - carried)
+    # Only a product rounded onto a tie needs the error to decide
+    floor = np.floor(scaled)
+    tie = scaled - floor == 0.5
+    rounded = np.where(
+        tie & (error > 0),
+        floor + 1,
+        np.where(tie & (error < 0), floor, np.round(scaled)),
+    )
+    return rounded / 10
+
+
+def evaluate_time_rows(
+    rows: pd.DataFrame,
+    users: Optional[list[str]] = None,
+    prize_full: float = 10.0,
+    discount: bool = False,
+    discount_rate: float = 1 / 3,
+    discount_full: float = 6.0,
+    discount_base: float = 30.0,
+) -> pd.DataFrame:
+    """
+    Apply the rules of `calculate_time` to member rows with grouped array operations,
+    returns a frame indexed by user with the same keys as `calculate_time`
+    """
+    if users is None:
+        users = list(rows["user"].unique())
+    index = pd.Index(users, name="user")
+    size = len(index)
+    codes = index.get_indexer(rows["user"])
+    kind = rows["kind"].to_numpy()
+    on = (rows["mode"] == "on-campus").to_numpy()
+    off = (rows["mode"] == "off-campus").to_numpy()
+    duration = rows["duration"].to_numpy(dtype=float)
+
+    def total(mask: np.ndarray) -> np.ndarray:
+        return _running_sums(_grid(codes[mask], duration[mask], size))[:, -1]
+
+    normal = kind == "normal"
+    special = kind == "special"
+    prize = kind == "prize"
+    trophy = kind == "trophy"
+
+    prize_on = total(prize & on)
+    prize_off = total(prize & off)
+    prize_total = total(prize)
+
+    # Prize activities reaching the limit are scaled to it and trophies are ignored
+    capped = prize_total >= prize_full
+    capped_on = _round(prize_on / np.where(capped, prize_total, 1.0) * prize_full)
+
+    # Trophies fill the rest in order, the one crossing the limit is truncated
+    trophy_duration = _grid(codes[trophy], duration[trophy], size)
+    trophy_on = _grid(codes[trophy], on[trophy], size)
+    running = _running_sums(trophy_duration, prize_total)
+    before, after = running[:, :-1], running[:, 1:]
+    kept = np.where(after <= prize_full, trophy_duration, 0.0)
+    added = np.where(
+        after <= prize_full,
+        trophy_duration,
+        np.where(before <= prize_full, prize_full - before, 0.0),
+    )
+
+    awards_on = np.where(
+        capped,
+        capped_on,
+        _running_sums(np.where(trophy_on, added, 0.0), prize_on)[:, -1],
+    )
+    awards_off = np.where(
+        capped,
+        prize_full - capped_on,
+        _running_sums(np.where(trophy_on, 0.0, added), prize_off)[:, -1],
+    )
+    awards_total = np.where(
+        capped, prize_full, _running_sums(kept, prize_total)[:, -1]
+    )
+
+    normal_on = total(normal & on)
+    normal_off = total(normal & off)
+    normal_social = total(normal & ~on & ~off)
+    special_on = total(special & on)
+    special_off = total(special & off)
+    special_social = total(special & ~on & ~off)
+
+    # Same order of additions as `combine_time`
+    on_campus = _round(awards_on + normal_on + special_on)
+    off_campus = _round(awards_off + normal_off + special_off)
+    if discount:
+        extra = np.minimum(
+            _round((on_campus - discount_base) * discount_rate), discount_full
+        )
+        off_campus = off_campus + np.where(on_campus > discount_base, extra, 0.0)
+    result = pd.DataFrame(index=index)
+    result["on-campus"] = on_campus
+    result["off-campus"] = off_campus
+    result["social-practice"] = _round(0.0 + normal_social + special_social)
+    result["trophy"] = _round(awards_total)
+    result["total"] = _round(
+        awards_total
+        + (normal_on + normal_off + normal_social)
+        + (special_on + special_off + special_social)
+    )
+    return result[columns]
+
+
+async def calculate_time_vector(
+    users: Optional[list[str]] = None,
+    prize_full: float = 10.0,
+    discount: bool = False,
+    discount_rate: float = 1 / 3,
+    discount_full: float = 6.0,
+    discount_base: float = 30.0,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> dict[str, dict[str, float]]:
+    """
+    Columnar counterpart of `calculate_time_batch` for whole grades or schools,
+    returns the same results. Durations which aren't all numbers, which the
+    scalar rules reject, are left to `calculate_time_batch`.
+    """
+    rows = await load_member_rows(users, start, end)
+    durations = rows["duration"]
+    if len(rows) and (
+        not pd.api.types.is_numeric_dtype(durations) or durations.isna().any()
+    ):
+        logging.warning("Non-numeric member durations, calculating time by user")
+        return await calculate_time_batch(
+            users,
+            prize_full,
+            discount,
+            discount_rate,
+            discount_full,
+            discount_base,
+            start,
+            end,
+        )
+    result = evaluate_time_rows(
+        rows,
+        users,
+        prize_full,
+        discount,
+        discount_rate,
+        discount_full,
+        discount_base,
+    )
+    return result.to_dict(orient="index")
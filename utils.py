@@ -9,7 +9,9 @@ from datetime import datetime, timezone
 from database import db
 from bson import ObjectId
 import settings
+from util.cache import LRUCache
 from util.cert import jwt_decode
+from util.revocation import revocations
 import requests
 import random
 import string
@@ -19,6 +21,9 @@ SECRET_KEY = open("aes_key.txt", "r").read()
 ALGORITHM = "HS256"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Claims of verified tokens, each entry expires with its token
+token_cache = LRUCache(max_entries=16384)
+
 
 def validate_object_id(id: str):
     try:
@@ -72,32 +77,47 @@ async def get_current_user(token: str = Depends(oauth2_scheme), scope: Optional[
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        # Decode JWT
-        payload = jwt_decode(token)
-        oid: str = payload.get("sub", None)
-        exp: int = payload.get("exp", None)
-        jti: str = payload.get("jti", None)
-
-        # Check if the token is valid
-        if oid is None or exp is None or jti is None:
+    claims = token_cache.get(token)
+    if claims is None:
+        try:
+            # Decode JWT
+            payload = jwt_decode(token)
+            oid: str = payload.get("sub", None)
+            exp: int = payload.get("exp", None)
+            jti: str = payload.get("jti", None)
+
+            # Check if the token is valid
+            if oid is None or exp is None or jti is None:
+                raise credentials_exception
+
+            # Check if the token is expired
+            if exp is not None and datetime.utcnow() >= datetime.fromtimestamp(exp):
+                raise credentials_exception
+        except jwt.PyJWTError:
             raise credentials_exception
 
-        # Check if the token is expired
-        if exp is not None and datetime.utcnow() >= datetime.fromtimestamp(exp):
-            raise credentials_exception
-        if scope == 'short' and payload['scope'] == 'access_token':
-            raise credentials_exception
-    except jwt.PyJWTError:
+        claims = {
+            "id": oid,
+            "per": payload.get("per", None),
+            "scope": payload.get("scope", None),
+            "jti": jti,
+            "exp": exp,
+        }
+        token_cache.put(token, claims, expires_at=exp)
+
+    if scope == 'short' and claims['scope'] == 'access_token':
+        raise credentials_exception
+    # Refresh tokens only mint new tokens at `/api/user/refresh`
+    if claims['scope'] == 'refresh_token':
+        raise credentials_exception
+    if revocations.is_revoked(claims['jti']):
         raise credentials_exception
 
     user = {
-        "id": oid,
-        "per": payload.get("per", None),
-        "scope": payload.get("scope", None),
+        "id": claims["id"],
+        "per": claims["per"],
+        "scope": claims["scope"],
     }
-    if user is None:
-        raise credentials_exception
     return user
 
 
@@ -113,6 +133,32 @@ def timestamp_change(date_string: str):
     # Return the timestamp
     return int(timestamp)
 
+def parse_iso_date(date_string: Optional[str]) -> Optional[datetime]:
+    """
+    Parse ISO-8601 to UTC datetime, None if it can't be parsed
+    """
+    if not date_string:
+        return None
+    try:
+        dt = datetime.fromisoformat(date_string)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def validate_date(date_string: Optional[str]) -> Optional[datetime]:
+    """
+    Parse an optional ISO-8601 query parameter
+    """
+    if date_string is None:
+        return None
+    dt = parse_iso_date(date_string)
+    if dt is None:
+        raise HTTPException(status_code=400, detail="Invalid date")
+    return dt
+
 def get_img_token_url(user_oid: str, per: str):
     url = urlparse(settings.IMGBED_SERVER)
     url._replace(path='/user/getToken')